@@ -2,37 +2,155 @@ import numpy as np
 from collections import deque
 import sounddevice as sd
 import sys
+import threading
 import time
 
 class NullAudioBackend:
-    def __init__(self, sample_rate):
+    """Device-less backend that pulls blocks from a render callback on its own clock.
+
+    Modes:
+    - 'realtime': one block per block period, like a sound card would
+    - 'freerun':  render as fast as possible (throughput / load testing)
+    - 'fixed':    one block every period / speed (e.g. speed=4.0 is 4x realtime)
+
+    The deadline for every block is its real audio duration, so deadline
+    misses are counted the same way in all modes.
+    """
+    modes = ['realtime', 'freerun', 'fixed']
+
+    def __init__(self, sample_rate, block_size=256, mode='realtime', speed=1.0, max_samples=None):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown null backend mode: {mode} (expected one of {self.modes})")
         self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.mode = mode
+        self.speed = max(1e-3, speed)
+        self.max_samples = max_samples
         self.is_running = False
         self.samples_written = 0
         self.peak_level = 0.0
-        
+
+        self.render_callback = None
+        self.thread = None
+        self.blocks_rendered = 0
+        self.render_time_total = 0.0
+        self.render_time_max = 0.0
+        self.deadline_misses = 0
+        self.wall_time = 0.0
+        self._start_time = None
+        self._stopped = False
+
+    def set_render_callback(self, callback):
+        """callback(num_samples) -> np.ndarray; starts rendering if already running"""
+        self.render_callback = callback
+        if self.is_running:
+            self._start_thread()
+
     def start(self):
         print("Starting null audio backend (no audio output)")
-        print("Audio will be simulated for testing purposes")
+        print(f"Audio will be rendered in '{self.mode}' mode for testing purposes")
         self.is_running = True
-        
+        self._stopped = False
+        self._start_time = time.perf_counter()
+        if self.render_callback is not None:
+            self._start_thread()
+
+    def _start_thread(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._render_loop, name="null-audio-render", daemon=True)
+        self.thread.start()
+
+    def _render_loop(self):
+        deadline = self.block_size / self.sample_rate
+        period = deadline / self.speed if self.mode == 'fixed' else deadline
+        next_tick = time.perf_counter()
+
+        while self.is_running:
+            t0 = time.perf_counter()
+            block = self.render_callback(self.block_size)
+            elapsed = time.perf_counter() - t0
+
+            self.write(block)
+            self.blocks_rendered += 1
+            self.render_time_total += elapsed
+            self.render_time_max = max(self.render_time_max, elapsed)
+            if elapsed > deadline:
+                self.deadline_misses += 1
+
+            if self.max_samples is not None and self.samples_written >= self.max_samples:
+                self.is_running = False
+                break
+
+            if self.mode != 'freerun':
+                next_tick += period
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Fell behind - resync instead of bursting to catch up
+                    next_tick = time.perf_counter()
+
+    def wait(self, timeout=None):
+        """Block until the render loop finishes (only returns early with max_samples)"""
+        if self.thread is not None:
+            self.thread.join(timeout)
+        elif timeout:
+            time.sleep(timeout)  # Nothing attached yet
+
+    def get_stats(self):
+        if self._start_time is not None:
+            self.wall_time = time.perf_counter() - self._start_time
+        audio_time = self.samples_written / self.sample_rate
+        blocks = max(1, self.blocks_rendered)
+        return {
+            'mode': self.mode,
+            'samples': self.samples_written,
+            'blocks': self.blocks_rendered,
+            'audio_seconds': audio_time,
+            'wall_seconds': self.wall_time,
+            'render_seconds': self.render_time_total,
+            'realtime_factor': audio_time / self.render_time_total if self.render_time_total > 0 else 0.0,
+            'mean_render_ms': self.render_time_total / blocks * 1000,
+            'max_render_ms': self.render_time_max * 1000,
+            'deadline_ms': self.block_size / self.sample_rate * 1000,
+            'deadline_misses': self.deadline_misses,
+            'peak_level': float(self.peak_level),
+        }
+
     def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self.is_running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        stats = self.get_stats()
         print("\nNull Audio Backend Statistics:")
         print("---------------------------")
-        print(f"Total samples processed: {self.samples_written}")
-        print(f"Duration: {self.samples_written / self.sample_rate:.1f} seconds")
-        print(f"Peak level: {self.peak_level:.1%}")
-        self.is_running = False
-        
+        print(f"Mode: {stats['mode']}")
+        print(f"Total samples processed: {stats['samples']}")
+        print(f"Duration: {stats['audio_seconds']:.1f} seconds")
+        print(f"Blocks rendered: {stats['blocks']}")
+        if stats['blocks']:
+            print(f"Throughput: {stats['realtime_factor']:.1f}x realtime")
+            print(f"Render time: {stats['mean_render_ms']:.3f} ms mean, {stats['max_render_ms']:.3f} ms max "
+                  f"(deadline {stats['deadline_ms']:.2f} ms)")
+            print(f"Deadline misses: {stats['deadline_misses']}")
+        print(f"Peak level: {stats['peak_level']:.1%}")
+
     def write(self, samples):
         self.samples_written += len(samples)
         if len(samples) > 0:
             self.peak_level = max(self.peak_level, np.max(np.abs(samples)))
 
 class AudioOutput:
-    def __init__(self, sample_rate, block_size):
+    def __init__(self, sample_rate, block_size, null_mode='realtime', null_speed=1.0, null_duration=None):
         self.sample_rate = sample_rate
         self.block_size = block_size
+        self.null_mode = null_mode
+        self.null_speed = null_speed
+        self.null_duration = null_duration  # Seconds of audio after which the null backend stops (None = never)
         self.buffer = deque(maxlen=block_size * 8)  # Increased buffer size for stability
         self.backend = None
         self.stream = None
@@ -138,7 +256,7 @@ class AudioOutput:
                 if not output_devices:
                     print("\nNo audio output devices found")
                     print("Falling back to null audio backend")
-                    self.backend = NullAudioBackend(self.sample_rate)
+                    self._create_null_backend()
                     self.backend.start()
                     return
                 
@@ -185,21 +303,33 @@ class AudioOutput:
                 
                 print("\nNo working audio devices found")
                 print("Falling back to null audio backend")
-                self.backend = NullAudioBackend(self.sample_rate)
+                self._create_null_backend()
                 self.backend.start()
                 
             except Exception as e:
                 print(f"\nError scanning audio devices: {e}")
                 print("Falling back to null audio backend")
-                self.backend = NullAudioBackend(self.sample_rate)
+                self._create_null_backend()
                 self.backend.start()
                 
         except Exception as e:
             print(f"\nFatal audio system error: {e}")
             print("Falling back to null audio backend")
-            self.backend = NullAudioBackend(self.sample_rate)
+            self._create_null_backend()
             self.backend.start()
     
+    def _create_null_backend(self):
+        max_samples = None if self.null_duration is None else int(self.null_duration * self.sample_rate)
+        self.backend = NullAudioBackend(self.sample_rate, self.block_size,
+                                        mode=self.null_mode, speed=self.null_speed, max_samples=max_samples)
+
+    def attach_renderer(self, callback):
+        """Let the null backend pull audio itself; returns False when a real device is used"""
+        if not self.backend:
+            return False
+        self.backend.set_render_callback(callback)
+        return True
+
     def write(self, samples):
         if self.backend:
             self.backend.write(samples)
@@ -0,0 +1,105 @@
+import json
+import os
+import platform
+import time
+import numpy as np
+from voice_manager import VoiceManager
+from resampler import PolyphaseResampler
+
+CANDIDATE_BLOCK_SIZES = [64, 128, 256, 512, 1024]
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'imperfectioner', 'blocksize.json')
+
+def host_key(device_rate, engine_rate, max_voices, safety_margin):
+    return '|'.join(str(part) for part in (
+        platform.node(), platform.machine(), platform.python_version(), np.__version__,
+        os.cpu_count(), device_rate, engine_rate, max_voices, safety_margin))
+
+def _load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(path, cache):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        print(f"Warning: could not save block size calibration: {e}")
+
+def _worst_case_renderer(device_rate, engine_rate, max_voices, wave_type):
+    voice_manager = VoiceManager(engine_rate, max_voices, verbose=False)
+    voice_manager.set_oscillator_type(wave_type)
+    # Long attack/decay keeps every voice in its most expensive (ramping) state
+    voice_manager.set_attack(2.0)
+    voice_manager.set_decay(2.0)
+    for i in range(max_voices):
+        voice_manager.note_on(48 + i, 100)
+
+    resampler = PolyphaseResampler(engine_rate, device_rate) if engine_rate != device_rate else None
+
+    def render(frames):
+        if resampler:
+            return resampler.pull(frames, voice_manager.get_audio_block)
+        return voice_manager.get_audio_block(frames)
+    return render
+
+def measure_render_time(render, block_size, blocks=64, percentile=99):
+    render(block_size)  # warm-up
+    times = np.empty(blocks)
+    for i in range(blocks):
+        start = time.perf_counter()
+        render(block_size)
+        times[i] = time.perf_counter() - start
+    return float(np.percentile(times, percentile))
+
+def calibrate_block_size(device_rate, engine_rate=None, max_voices=16, safety_margin=0.5,
+                         candidates=None, cache_path=CACHE_PATH, force=False):
+    """Smallest block size whose worst-case render fits within safety_margin of its deadline.
+
+    The worst case is full polyphony on the most expensive waveform. Results are
+    cached per host/configuration in cache_path; pass force=True to re-measure.
+    """
+    engine_rate = engine_rate or device_rate
+    candidates = sorted(candidates or CANDIDATE_BLOCK_SIZES)
+    key = host_key(device_rate, engine_rate, max_voices, safety_margin)
+
+    cache = _load_cache(cache_path) if cache_path else {}
+    if not force and key in cache:
+        print(f"Block size: {cache[key]['block_size']} samples (cached calibration)")
+        return cache[key]['block_size']
+
+    print("\nCalibrating block size...")
+    print("-----------------------")
+
+    # Find the most expensive waveform on this host at a mid-size block
+    probe = candidates[len(candidates) // 2]
+    waveforms = VoiceManager(engine_rate, 1, verbose=False).voices[0].oscillator.types
+    costs = [measure_render_time(_worst_case_renderer(device_rate, engine_rate, max_voices, i), probe, blocks=16)
+             for i in range(len(waveforms))]
+    worst = int(np.argmax(costs))
+    print(f"Worst-case waveform: {waveforms[worst]} ({max_voices} voices)")
+
+    chosen = candidates[-1]
+    results = {}
+    for block_size in candidates:
+        render = _worst_case_renderer(device_rate, engine_rate, max_voices, worst)
+        elapsed = measure_render_time(render, block_size)
+        deadline = block_size / device_rate
+        results[block_size] = elapsed / deadline
+        print(f"  {block_size:5d} samples: {elapsed*1000:.3f} ms of {deadline*1000:.2f} ms "
+              f"({elapsed/deadline:.0%} load)")
+        if elapsed <= deadline * safety_margin:
+            chosen = block_size
+            break
+    else:
+        print("Warning: no candidate met the safety margin; using the largest block size")
+
+    print(f"Selected block size: {chosen} samples ({chosen/device_rate*1000:.1f} ms)")
+    if cache_path:
+        cache[key] = {'block_size': chosen, 'waveform': waveforms[worst],
+                      'load': {str(k): v for k, v in results.items()}}
+        _save_cache(cache_path, cache)
+    return chosen
@@ -1,5 +1,34 @@
 import numpy as np
 
+# Quality tier -> control rate (samples per envelope/modulation value; 1 = every sample)
+QUALITY_TIERS = {'high': 1, 'medium': 16, 'low': 64}
+
+def control_rate_for(patch, default=1):
+    """Control rate from a patch's 'control_rate' or 'quality' tier"""
+    if 'control_rate' in patch:
+        return max(1, int(patch['control_rate']))
+    if 'quality' in patch:
+        return QUALITY_TIERS[patch['quality']]
+    return default
+
+def control_grid(num_samples, control_rate):
+    """Offsets of the control points covering a block: 0, k, 2k, ... and num_samples itself"""
+    return np.append(np.arange(0, num_samples, control_rate), num_samples)
+
+def expand_control(values, grid, num_samples):
+    """Linearly interpolate (..., points) control values at grid offsets to (..., num_samples)"""
+    step = int(grid[1] - grid[0]) if len(grid) > 1 else 1
+    if num_samples % step == 0:
+        # Whole control periods: one broadcast multiply-add over (..., periods, step)
+        start = values[..., :-1, None]
+        slope = (values[..., 1:, None] - start) / step
+        return (start + slope * np.arange(step)).reshape(values.shape[:-1] + (num_samples,))
+    ramp = np.arange(num_samples)
+    index = np.searchsorted(grid, ramp, side='right') - 1
+    frac = (ramp - grid[index]) / (grid[index + 1] - grid[index])
+    start = values[..., index]
+    return start + (values[..., index + 1] - start) * frac
+
 class ADSREnvelope:
     def __init__(self, sample_rate):
         self.sample_rate = sample_rate
@@ -11,6 +40,7 @@ class ADSREnvelope:
         self.current_level = 0.0
         self.state = 'idle'
         self.samples_processed = 0
+        self.control_rate = 1  # Control period in samples; only used to glide sustain changes (levels stay per sample)
         
     def set_attack(self, attack_time):
         self.attack = max(0.001, attack_time)
@@ -32,6 +62,16 @@ class ADSREnvelope:
         self.state = 'release'
         self.samples_processed = 0
         
+    def constant_level(self):
+        """Level if the envelope holds still for a whole block (sustain/idle), else None"""
+        if self.state == 'sustain':
+            if self.control_rate > 1 and self.current_level != self.sustain:
+                return None  # Sustain changed: glide to it over one control period
+            return self.sustain
+        if self.state == 'idle':
+            return 0.0
+        return None
+
     def get_envelope(self, num_samples):
         envelope = np.zeros(num_samples)
         current_sample = 0
@@ -43,7 +83,7 @@ class ADSREnvelope:
                 
             elif self.state == 'attack':
                 attack_samples = int(self.attack * self.sample_rate)
-                remaining = attack_samples - self.samples_processed
+                remaining = max(0, attack_samples - self.samples_processed)
                 samples_to_process = min(remaining, num_samples - current_sample)
                 
                 t = np.linspace(self.current_level,
@@ -61,7 +101,7 @@ class ADSREnvelope:
                     
             elif self.state == 'decay':
                 decay_samples = int(self.decay * self.sample_rate)
-                remaining = decay_samples - self.samples_processed
+                remaining = max(0, decay_samples - self.samples_processed)
                 samples_to_process = min(remaining, num_samples - current_sample)
                 
                 t = np.linspace(self.current_level,
@@ -79,12 +119,17 @@ class ADSREnvelope:
             elif self.state == 'sustain':
                 samples_to_process = num_samples - current_sample
                 envelope[current_sample:] = self.sustain
+                if self.control_rate > 1 and self.current_level != self.sustain:
+                    # Sustain changed while held: glide over one control period instead of stepping
+                    glide = min(self.control_rate, samples_to_process)
+                    envelope[current_sample:current_sample + glide] = np.linspace(
+                        self.current_level, self.sustain, glide + 1)[:-1]
                 current_sample = num_samples
                 self.current_level = self.sustain
                 
             elif self.state == 'release':
                 release_samples = int(self.release * self.sample_rate)
-                remaining = release_samples - self.samples_processed
+                remaining = max(0, release_samples - self.samples_processed)
                 samples_to_process = min(remaining, num_samples - current_sample)
                 
                 t = np.linspace(self.current_level,
@@ -0,0 +1,166 @@
+"""Reference-vs-candidate numerical equivalence harness.
+
+Drives the frozen reference renderer (reference_engine.py) and a candidate
+engine with the same randomized event script (note-ons, note-offs, bursts
+that force voice stealing, ADSR CC changes and waveform switches). It then
+compares their output sample by sample and times both on the same script.
+
+A candidate is any factory(sample_rate) returning an object with note_on,
+note_off, handle_control_change and get_audio_block (the VoiceManager API).
+
+    python equivalence.py                  # all registered candidates
+    python equivalence.py -c render_cache  # just one, with its declared tolerance
+
+Candidates can instead be compared against a baseline engine of their own,
+on percussive scripts that hold sustain at 0. That is how the render cache is
+checked: with the cache on, one-shots restart from phase 0 (the frozen
+reference free-runs), so its contract is "identical to the same engine
+rendering key-synced one-shots live".
+"""
+import time
+import numpy as np
+from reference_engine import ReferenceVoiceManager
+from voice_manager import VoiceManager
+
+def generate_script(seed, blocks=400, max_burst=20, percussive=False):
+    """Random event script: one list of events per block.
+
+    Events are ('on', note, velocity), ('off', note) and ('cc', control, value).
+    Percussive scripts set sustain (CC 75) to 0 first and keep it there, so
+    every note is a one-shot.
+    """
+    rng = np.random.default_rng(seed)
+    held = []
+    script = [[('cc', 75, 0)]] if percussive else []
+    for _ in range(blocks):
+        events = []
+        roll = rng.random()
+        if roll < 0.02:
+            # Burst larger than the voice pool to exercise stealing
+            for _ in range(int(rng.integers(8, max_burst + 1))):
+                note = int(rng.integers(24, 108))
+                events.append(('on', note, int(rng.integers(1, 128))))
+                held.append(note)
+        elif roll < 0.25:
+            note = int(rng.integers(24, 108))
+            events.append(('on', note, int(rng.integers(1, 128))))
+            held.append(note)
+        if held and rng.random() < 0.2:
+            events.append(('off', held.pop(int(rng.integers(len(held))))))
+        if rng.random() < 0.04:
+            control = int(rng.choice([73, 74, 76, 77] if percussive else [73, 74, 75, 76, 77]))
+            # Keep envelope times short enough that notes actually evolve within a script
+            value = int(rng.integers(0, 128 if control in (75, 77) else 40))
+            if control == 75 and rng.random() < 0.25:
+                value = 0  # Percussive (one-shot) notes
+            events.append(('cc', control, value))
+        script.append(events)
+    return script[:blocks]
+
+def run_script(engine, script, block_size):
+    """Render script through engine; returns (samples, per-block render seconds)"""
+    output = np.empty(len(script) * block_size)
+    times = np.empty(len(script))
+    for i, events in enumerate(script):
+        for event in events:
+            if event[0] == 'on':
+                engine.note_on(event[1], event[2])
+            elif event[0] == 'off':
+                engine.note_off(event[1])
+            else:
+                engine.handle_control_change(event[1], event[2])
+        start = time.perf_counter()
+        output[i * block_size:(i + 1) * block_size] = engine.get_audio_block(block_size)
+        times[i] = time.perf_counter() - start
+    return output, times
+
+def compare(reference, candidate, atol=1e-9, rtol=0.0):
+    error = np.abs(candidate - reference)
+    diverged = np.flatnonzero(error > atol + rtol * np.abs(reference))
+    return {
+        'max_error': float(error.max()) if len(error) else 0.0,
+        'rms_error': float(np.sqrt(np.mean(error ** 2))) if len(error) else 0.0,
+        'first_divergence': int(diverged[0]) if len(diverged) else None,
+        'divergent_samples': int(len(diverged)),
+        'passed': len(diverged) == 0,
+    }
+
+def check_candidate(factory, seeds=range(5), blocks=400, block_size=256, sample_rate=44100,
+                    atol=1e-9, rtol=0.0, baseline=None, percussive=False):
+    """Compare factory against baseline (default: the reference) on each seed's script; one report per seed"""
+    baseline = baseline or ReferenceVoiceManager
+    reports = []
+    for seed in seeds:
+        script = generate_script(seed, blocks, percussive=percussive)
+        reference, reference_times = run_script(baseline(sample_rate), script, block_size)
+        engine = factory(sample_rate)
+        candidate, candidate_times = run_script(engine, script, block_size)
+        report = compare(reference, candidate, atol, rtol)
+        cache = getattr(engine, 'render_cache', None)
+        if cache is not None:
+            report['cache'] = cache.get_stats()
+        if report['first_divergence'] is not None:
+            report['first_divergent_block'] = report['first_divergence'] // block_size
+        report['seed'] = seed
+        report['reference_ms'] = reference_times.sum() * 1000
+        report['candidate_ms'] = candidate_times.sum() * 1000
+        report['speedup'] = reference_times.sum() / candidate_times.sum() if candidate_times.sum() else 0.0
+        reports.append(report)
+    return reports
+
+def _voice_manager_engine(sample_rate):
+    return VoiceManager(sample_rate, verbose=False, silence_threshold_db=None)
+
+def _key_sync_engine(sample_rate):
+    # Live rendering with the cache's key sync, but nothing cached
+    engine = _voice_manager_engine(sample_rate)
+    for voice in engine.voices:
+        voice.key_sync = True
+    return engine
+
+def _render_cache_engine(sample_rate):
+    engine = _voice_manager_engine(sample_rate)
+    engine.enable_render_cache()
+    return engine
+
+# name -> (factory, atol, rtol, strict, baseline, percussive). Tolerances are part of each
+# candidate's contract; baseline None means the frozen reference.
+# Non-strict candidates change the sound on purpose and are reported for information only:
+# silence culling frees silent voices, which changes both voice stealing and the
+# active-voice mix normalization.
+CANDIDATES = {
+    'voice_manager': (_voice_manager_engine, 1e-9, 0.0, True, None, False),
+    'render_cache': (_render_cache_engine, 1e-9, 0.0, True, _key_sync_engine, True),
+    'silence_culling': (lambda sr: VoiceManager(sr, verbose=False), 1e-9, 0.0, False, None, False),
+}
+
+def print_reports(name, reports, strict=True):
+    print(f"\n{name}" + ("" if strict else " (informational)"))
+    print("-" * len(name))
+    for r in reports:
+        status = "PASS" if r['passed'] else ("FAIL" if strict else "DIFF")
+        line = (f"  seed {r['seed']}: {status}  max {r['max_error']:.2e}  rms {r['rms_error']:.2e}  "
+                f"speedup {r['speedup']:.2f}x ({r['reference_ms']:.1f} -> {r['candidate_ms']:.1f} ms)")
+        if 'cache' in r:
+            line += f"  cache {r['cache']['hits']} hits / {r['cache']['misses']} misses"
+        if not r['passed']:
+            line += f"  first divergence at sample {r['first_divergence']} (block {r['first_divergent_block']})"
+        print(line)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Compare render engines against the frozen reference")
+    parser.add_argument('-c', '--candidate', action='append', choices=sorted(CANDIDATES))
+    parser.add_argument('--seeds', type=int, default=5)
+    parser.add_argument('--blocks', type=int, default=400)
+    parser.add_argument('--block-size', type=int, default=256)
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.candidate or CANDIDATES:
+        factory, atol, rtol, strict, baseline, percussive = CANDIDATES[name]
+        reports = check_candidate(factory, range(args.seeds), args.blocks, args.block_size, atol=atol, rtol=rtol,
+                                  baseline=baseline, percussive=percussive)
+        print_reports(name, reports, strict)
+        failed |= strict and not all(r['passed'] for r in reports)
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,321 @@
+import numpy as np
+from envelope import control_grid, control_rate_for, expand_control
+from voice_manager import Voice
+from profiler import profiler
+
+# name -> operators, (modulator, target) connections, carriers, self-feedback operator (or None)
+ALGORITHMS = {
+    'stack4':    {'operators': 4, 'modulation': [(3, 2), (2, 1), (1, 0)], 'carriers': [0], 'feedback': 3},
+    'pairs4':    {'operators': 4, 'modulation': [(1, 0), (3, 2)], 'carriers': [0, 2], 'feedback': 3},
+    'branch4':   {'operators': 4, 'modulation': [(1, 0), (2, 0), (3, 0)], 'carriers': [0], 'feedback': 3},
+    'additive4': {'operators': 4, 'modulation': [], 'carriers': [0, 1, 2, 3], 'feedback': 3},
+    'epiano6':   {'operators': 6, 'modulation': [(1, 0), (5, 4), (4, 3), (3, 2)], 'carriers': [0, 2],
+                  'feedback': 5},
+    'stack6':    {'operators': 6, 'modulation': [(5, 4), (4, 3), (3, 2), (2, 1), (1, 0)], 'carriers': [0],
+                  'feedback': 5},
+    'triple6':   {'operators': 6, 'modulation': [(1, 0), (3, 2), (5, 4)], 'carriers': [0, 2, 4],
+                  'feedback': 5},
+    'organ6':    {'operators': 6, 'modulation': [(5, 4)], 'carriers': [0, 1, 2, 3, 4], 'feedback': 5},
+}
+
+NOT_RELEASED = float(2 ** 62)  # off_age of a held note; finite so envelope math stays warning-free
+
+DEFAULT_OPERATOR = {'ratio': 1.0, 'detune': 0.0, 'level': 0.0,
+                    'attack': 0.01, 'decay': 0.3, 'sustain': 0.7, 'release': 0.3}
+
+# Operator levels are output amplitudes for carriers and modulation indices (radians) for modulators
+FM_PRESETS = {
+    'epiano': {'algorithm': 'epiano6', 'feedback': 0.3, 'operators': [
+        {'ratio': 1.0, 'level': 1.0, 'attack': 0.002, 'decay': 1.5, 'sustain': 0.2, 'release': 0.4},
+        {'ratio': 14.0, 'level': 0.6, 'attack': 0.001, 'decay': 0.25, 'sustain': 0.0, 'release': 0.2},
+        {'ratio': 1.0, 'level': 1.0, 'attack': 0.002, 'decay': 2.0, 'sustain': 0.3, 'release': 0.5},
+        {'ratio': 1.0, 'level': 1.2, 'attack': 0.002, 'decay': 1.0, 'sustain': 0.2, 'release': 0.4},
+        {'ratio': 1.0, 'level': 0.8, 'attack': 0.002, 'decay': 0.8, 'sustain': 0.1, 'release': 0.4},
+        {'ratio': 1.0, 'level': 0.5, 'attack': 0.002, 'decay': 0.5, 'sustain': 0.0, 'release': 0.3},
+    ]},
+    'bell': {'algorithm': 'pairs4', 'feedback': 0.0, 'operators': [
+        {'ratio': 1.0, 'level': 1.0, 'attack': 0.001, 'decay': 3.0, 'sustain': 0.0, 'release': 1.5},
+        {'ratio': 3.5, 'level': 2.5, 'attack': 0.001, 'decay': 2.0, 'sustain': 0.0, 'release': 1.0},
+        {'ratio': 2.0, 'level': 0.6, 'attack': 0.001, 'decay': 1.5, 'sustain': 0.0, 'release': 1.0},
+        {'ratio': 5.19, 'level': 1.5, 'attack': 0.001, 'decay': 1.0, 'sustain': 0.0, 'release': 0.8},
+    ]},
+    'bass': {'algorithm': 'stack4', 'feedback': 0.6, 'operators': [
+        {'ratio': 0.5, 'level': 1.0, 'attack': 0.002, 'decay': 0.6, 'sustain': 0.6, 'release': 0.1},
+        {'ratio': 0.5, 'level': 2.0, 'attack': 0.002, 'decay': 0.3, 'sustain': 0.3, 'release': 0.1},
+        {'ratio': 1.0, 'level': 1.0, 'attack': 0.002, 'decay': 0.2, 'sustain': 0.2, 'release': 0.1},
+        {'ratio': 1.0, 'level': 0.5, 'attack': 0.002, 'decay': 0.1, 'sustain': 0.0, 'release': 0.1},
+    ]},
+    'brass': {'algorithm': 'stack6', 'feedback': 0.5, 'operators': [
+        {'ratio': 1.0, 'level': 1.0, 'attack': 0.06, 'decay': 0.3, 'sustain': 0.8, 'release': 0.2},
+        {'ratio': 1.0, 'level': 1.8, 'attack': 0.08, 'decay': 0.4, 'sustain': 0.6, 'release': 0.2},
+        {'ratio': 1.0, 'level': 1.0, 'attack': 0.1, 'decay': 0.5, 'sustain': 0.5, 'release': 0.2},
+        {'ratio': 2.0, 'level': 0.6, 'attack': 0.1, 'decay': 0.5, 'sustain': 0.4, 'release': 0.2},
+        {'ratio': 1.0, 'level': 0.4, 'attack': 0.1, 'decay': 0.5, 'sustain': 0.3, 'release': 0.2},
+        {'ratio': 1.0, 'level': 0.3, 'attack': 0.05, 'decay': 0.5, 'sustain': 0.3, 'release': 0.2},
+    ]},
+}
+
+def algorithm_stages(algorithm):
+    """Group operators into stages that only depend on earlier stages.
+
+    Returns [(operators, modulators, weights), ...] where weights[i, j] = 1
+    when modulators[j] modulates operators[i].
+    """
+    count = algorithm['operators']
+    sources = {op: sorted(src for src, dst in algorithm['modulation'] if dst == op) for op in range(count)}
+    depth = {}
+
+    def op_depth(op, path=()):
+        if op in path:
+            raise ValueError(f"FM algorithm has a modulation cycle through operator {op + 1}")
+        if op not in depth:
+            depth[op] = 1 + max((op_depth(src, path + (op,)) for src in sources[op]), default=-1)
+        return depth[op]
+
+    for op in range(count):
+        op_depth(op)
+    stages = []
+    for level in range(max(depth.values()) + 1):
+        ops = [op for op in range(count) if depth[op] == level]
+        modulators = sorted({src for op in ops for src in sources[op]})
+        weights = np.array([[1.0 if src in sources[op] else 0.0 for src in modulators] for op in ops])
+        stages.append((np.array(ops), np.array(modulators, dtype=np.intp), weights.reshape(len(ops), -1)))
+    return stages
+
+class FMBank:
+    """Operator state for every voice of a VoiceManager, rendered as one batch per block.
+
+    Phases, envelope timing and levels live in (voices, operators) arrays. Each
+    algorithm stage is evaluated for all sounding voices at once over a
+    (voices, stage operators, frames) array, with its modulation input a single
+    matmul of the modulation weights with the outputs of earlier stages.
+    Operator envelopes are linear ADSRs computed in closed form from the
+    time since note-on/note-off, so they need no per-voice state machine.
+    With control_rate above 1 they are only evaluated every control_rate
+    samples and interpolated, which is exact apart from rounded corners.
+    """
+    feedback_iterations = 3
+
+    def __init__(self, sample_rate, max_voices, patch=None):
+        self.sample_rate = sample_rate
+        self.max_voices = max_voices
+        self.mod_depth = 1.0  # Scales every modulation index (mod wheel)
+        self._depth = 1.0  # mod_depth the last block ended on
+        self.control_rate = 1  # Samples per envelope/modulation value; 1 = every sample
+        self.output = np.zeros((max_voices, 0))
+        self._ramp = np.arange(0)
+        self.configure(patch or FM_PRESETS['epiano'])
+
+    def configure(self, patch):
+        """Apply an FM patch: algorithm (name or dict), feedback and per-operator parameters"""
+        self.patch = patch
+        algorithm = patch.get('algorithm', 'stack4')
+        self.algorithm_name = algorithm if isinstance(algorithm, str) else 'custom'
+        self.algorithm = ALGORITHMS[algorithm] if isinstance(algorithm, str) else algorithm
+        self.operators = self.algorithm['operators']
+        self.feedback = float(np.clip(patch.get('feedback', 0.0), 0.0, 1.0))
+        self.control_rate = control_rate_for(patch, self.control_rate)
+
+        ops = [{**DEFAULT_OPERATOR, **op} for op in patch.get('operators', [])][:self.operators]
+        ops += [dict(DEFAULT_OPERATOR) for _ in range(self.operators - len(ops))]
+        self.ratios = np.array([op['ratio'] * 2.0 ** (op['detune'] / 1200.0) for op in ops])
+        self.levels = np.array([op['level'] for op in ops], dtype=float)
+        self.attack = np.array([max(1, int(op['attack'] * self.sample_rate)) for op in ops])
+        self.decay = np.array([max(1, int(op['decay'] * self.sample_rate)) for op in ops])
+        self.sustain = np.clip([op['sustain'] for op in ops], 0.0, 1.0)
+        self.release = np.array([max(1, int(op['release'] * self.sample_rate)) for op in ops])
+        self._set_algorithm(self.algorithm)
+        self.reset()
+
+    def _set_algorithm(self, algorithm):
+        self.algorithm = algorithm
+        self.stages = algorithm_stages(algorithm)
+        self.carriers = np.array(algorithm['carriers'])
+        self.feedback_op = algorithm.get('feedback')
+        self._is_carrier = np.isin(np.arange(self.operators), self.carriers)
+
+    def select_algorithm(self, index):
+        """Switch to the index-th algorithm with the same operator count (CC 77)"""
+        names = [name for name, alg in ALGORITHMS.items() if alg['operators'] == self.operators]
+        self.algorithm_name = names[index % len(names)]
+        self._set_algorithm(ALGORITHMS[self.algorithm_name])
+
+    def set_carrier_envelope(self, stage, value):
+        """Set one ADSR stage on every carrier operator; modulator envelopes keep their own shape"""
+        if stage == 'sustain':
+            self.sustain[self.carriers] = np.clip(value, 0.0, 1.0)
+        else:
+            getattr(self, stage)[self.carriers] = max(1, int(max(0.001, value) * self.sample_rate))
+
+    def reset(self):
+        shape = (self.max_voices, self.operators)
+        self.active = np.zeros(self.max_voices, dtype=bool)
+        self.freqs = np.zeros(self.max_voices)
+        self.velocity = np.zeros(self.max_voices)
+        self.phases = np.zeros(shape)  # cycles
+        self.age = np.zeros(self.max_voices)  # samples since note-on
+        self.off_age = np.full(self.max_voices, NOT_RELEASED)  # age at note-off
+        self.start_level = np.zeros(shape)  # envelope level at note-on (retrigger)
+        self.release_level = np.zeros(shape)
+        self.env_level = np.zeros(shape)  # envelope level at the end of the last block
+
+    def note_on(self, row, freq, velocity):
+        if not self.active[row]:
+            self.phases[row] = 0.0  # Key sync; a stolen row keeps running to avoid a click
+        self.active[row] = True
+        self.freqs[row] = freq
+        self.velocity[row] = velocity
+        self.age[row] = 0.0
+        self.off_age[row] = NOT_RELEASED
+        self.start_level[row] = self.env_level[row]
+
+    def note_off(self, row):
+        if self.active[row] and not self.released(row):
+            self.off_age[row] = self.age[row]
+            self.release_level[row] = self.env_level[row]
+
+    def stop(self, row):
+        self.active[row] = False
+        self.env_level[row] = 0.0
+
+    def level(self, row):
+        """Loudest carrier envelope of row, scaled by carrier level and velocity"""
+        return float((self.env_level[row, self.carriers] * self.levels[self.carriers]).max() * self.velocity[row])
+
+    def released(self, row):
+        return self.off_age[row] < NOT_RELEASED
+
+    def settled(self, row):
+        """Every carrier is past its attack and decay (or released)"""
+        return self.released(row) or bool(np.all(self.age[row] >= (self.attack + self.decay)[self.carriers]))
+
+    def envelopes(self, rows, offsets):
+        """(rows, operators, len(offsets)) envelope levels at sample offsets into the block.
+
+        Held notes: min(attack line, max(decay line, sustain)) is the whole
+        attack/decay/sustain shape in two ufuncs. Note-offs only happen
+        between blocks, so released rows are in release for the whole block.
+        """
+        t = (self.age[rows, None] + offsets)[:, None, :]  # samples since note-on
+        start = self.start_level[rows]
+        decay_slope = (self.sustain - 1.0) / self.decay
+        attack_line = t * ((1.0 - start) / self.attack)[:, :, None] + start[:, :, None]
+        decay_line = t * decay_slope[:, None] + (1.0 - self.attack * decay_slope)[:, None]
+        envelopes = np.minimum(attack_line, np.maximum(decay_line, self.sustain[:, None]))
+
+        released = self.off_age[rows] < NOT_RELEASED
+        if released.any():
+            since_off = t[released] - self.off_age[rows[released], None, None]
+            level = self.release_level[rows[released]][:, :, None]
+            envelopes[released] = level * np.maximum(0.0, 1.0 - since_off / self.release[:, None])
+        return envelopes
+
+    def render(self, num_samples):
+        """Render every active row into self.output[row]"""
+        if self.output.shape[1] != num_samples:
+            self.output = np.zeros((self.max_voices, num_samples))
+            self._ramp = np.arange(num_samples)
+        rows = np.flatnonzero(self.active)
+        if not len(rows):
+            return
+
+        increments = self.freqs[rows, None] * self.ratios / self.sample_rate  # cycles per sample
+        theta = 2.0 * np.pi * (self.phases[rows][:, :, None] + increments[:, :, None] * self._ramp)
+        if self.control_rate > 1:
+            # Envelopes and modulation depth on the control grid, interpolated to audio rate;
+            # a mod depth change glides over the first control period
+            grid = control_grid(num_samples, self.control_rate)
+            envelopes = self.envelopes(rows, grid)
+            depth = np.full(len(grid), self.mod_depth)
+            depth[0] = self._depth
+            depth = np.where(self._is_carrier[:, None], 1.0, depth)
+            gains = expand_control(envelopes * (self.levels[:, None] * depth), grid, num_samples)
+        else:
+            envelopes = self.envelopes(rows, self._ramp)
+            depth = np.where(self._is_carrier, 1.0, self.mod_depth)
+            gains = envelopes * (self.levels * depth)[:, None]
+        self._depth = self.mod_depth
+
+        outputs = np.empty((len(rows), self.operators, num_samples))
+        for ops, modulators, weights in self.stages:
+            phase = theta[:, ops]
+            if len(modulators):
+                phase += weights @ outputs[:, modulators]
+            signal = np.sin(phase)
+            if self.feedback and self.feedback_op in ops:
+                # Self-feedback y = sin(phase + fb * y), solved by fixed-point iteration across the block
+                i = int(np.flatnonzero(ops == self.feedback_op)[0])
+                for _ in range(self.feedback_iterations):
+                    signal[:, i] = np.sin(phase[:, i] + self.feedback * signal[:, i])
+            outputs[:, ops] = signal * gains[:, ops]
+
+        self.output[rows] = outputs[:, self.carriers].sum(axis=1) * (self.velocity[rows, None] / len(self.carriers))
+
+        self.phases[rows] = (self.phases[rows] + increments * num_samples) % 1.0
+        self.age[rows] += num_samples
+        self.env_level[rows] = envelopes[:, :, -1]
+
+        # Rows whose carriers have all finished releasing
+        done = (self.age[rows] - self.off_age[rows]) >= self.release[self.carriers].max()
+        self.active[rows[done]] = False
+        self.env_level[rows[done]] = 0.0
+
+class FMVoice(Voice):
+    """Voice slot backed by a row of a shared FMBank; the bank renders all rows at once"""
+    def __init__(self, sample_rate, bank):
+        super().__init__(sample_rate)
+        self.bank = bank
+
+    def note_on(self, note, velocity):
+        super().note_on(note, velocity)
+        self.cache_pending = False
+        self.bank.note_on(self.index, self.oscillator.freq, self.velocity)
+
+    def note_off(self):
+        self.envelope.note_off()
+        self.bank.note_off(self.index)
+
+    def is_one_shot(self):
+        return False
+
+    def set_unison(self, unison, detune=20.0, spread=0.5):
+        pass  # Operators replace the oscillator stack
+
+    def live_oscillator(self):
+        return None  # The bank renders the operators
+
+    def is_active(self):
+        return self.active and bool(self.bank.active[self.index])
+
+    def retire(self):
+        super().retire()
+        self.bank.stop(self.index)
+
+    def level(self):
+        return self.bank.level(self.index)
+
+    def apply_fade(self, samples):
+        samples = super().apply_fade(samples)
+        if not self.active:
+            self.bank.stop(self.index)
+        return samples
+
+    def generate_samples(self, num_samples):
+        samples = self.bank.output[self.index].copy()
+        if not self.bank.active[self.index]:
+            self.active = False
+        elif self.bank.settled(self.index) and self.bank.level(self.index) <= self.silence_threshold:
+            self.retire()  # Inaudible tail
+        return samples
+
+def load_fm(voice_manager, patch=None):
+    """Switch every voice in voice_manager to FM synthesis with patch (an FM_PRESETS name or dict)"""
+    if isinstance(patch, str):
+        patch = FM_PRESETS[patch]
+    bank = FMBank(voice_manager.sample_rate, len(voice_manager.voices), patch)
+    voice_manager.set_voice_factory(lambda sample_rate: FMVoice(sample_rate, bank))
+    voice_manager.banks = [bank]
+    voice_manager.set_control_rate(control_rate_for(bank.patch, voice_manager.control_rate))
+    return bank
+
+profiler.register(FMBank, 'render', 'oscillator', waveform=lambda bank: 'fm')
@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+import numpy as np
+from resampler import PolyphaseResampler
+
+def to_db(level, floor=-120.0):
+    return max(floor, 20.0 * np.log10(level)) if level > 0 else floor
+
+class MeterTap:
+    """Single-producer/single-consumer ring the audio callback copies blocks into.
+
+    push() is the only call made on the audio thread: it copies the block into
+    preallocated storage and advances a counter. Each counter has exactly one
+    writer, so no lock is needed. When the meter falls behind, new blocks are
+    dropped (and counted) instead of overwriting unread audio.
+    """
+    def __init__(self, channels, capacity=1 << 15):
+        self.channels = channels
+        self.capacity = capacity
+        self.buffer = np.zeros((capacity, channels))
+        self.written = 0
+        self.read = 0
+        self.dropped = 0
+
+    def push(self, block):
+        frames = len(block)
+        if self.capacity - (self.written - self.read) < frames:
+            self.dropped += frames
+            return
+        block = block.reshape(frames, -1)
+        start = self.written % self.capacity
+        first = min(frames, self.capacity - start)
+        self.buffer[start:start + first] = block[:first]
+        self.buffer[:frames - first] = block[first:]
+        self.written += frames
+
+    def pop(self):
+        """Copy of every frame pushed since the last pop, shape (frames, channels)"""
+        available = self.written - self.read
+        indices = (self.read + np.arange(available)) % self.capacity
+        frames = self.buffer[indices]
+        self.read += available
+        return frames
+
+class LevelMeter:
+    """Background analysis of a MeterTap: levels per channel and per part, plus spectra.
+
+    Every 1/update_rate seconds the meter drains the tap and updates peak,
+    RMS (exponential window of rms_window seconds) and true-peak (4x
+    oversampled) levels. Spectra of each part are recomputed at the lower
+    spectrum_rate from the last fft_size frames. Parts group channels, e.g.
+    {'main': [0, 1], 'send0': [2]}. Results are swapped in whole, so the
+    query methods can be called from any thread.
+    """
+    def __init__(self, tap, sample_rate, channel_names=None, parts=None, update_rate=30.0,
+                 spectrum_rate=5.0, fft_size=4096, rms_window=0.3, oversample=4):
+        self.tap = tap
+        self.sample_rate = sample_rate
+        self.channel_names = channel_names or [f"ch{i}" for i in range(tap.channels)]
+        self.parts = parts or {'main': list(range(tap.channels))}
+        self.update_rate = update_rate
+        self.spectrum_interval = 1.0 / spectrum_rate
+        self.fft_size = fft_size
+        self.rms_window = rms_window
+        self.oversampler = PolyphaseResampler(sample_rate, sample_rate * oversample)
+        self.window = np.hanning(fft_size)
+        self.frequencies = np.fft.rfftfreq(fft_size, 1.0 / sample_rate)
+        self.thread = None
+        self._stop = threading.Event()
+        self.reset()
+
+    def reset(self):
+        channels = self.tap.channels
+        self.mean_square = np.zeros(channels)
+        self.max_peak = np.zeros(channels)
+        self.max_true_peak = np.zeros(channels)
+        self.clipped = np.zeros(channels, dtype=np.int64)
+        self.frames_metered = 0
+        self.history = np.zeros((self.fft_size, len(self.parts)))
+        self._last_spectrum = 0.0
+        self.oversampler.reset()
+        self.levels = {}
+        self.spectra = {}
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, name="level-meter", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.process()  # Meter whatever arrived after the last update
+
+    def _run(self):
+        while not self._stop.wait(1.0 / self.update_rate):
+            self.process()
+
+    def process(self):
+        """Drain the tap and update levels; safe to call directly for offline metering"""
+        frames = self.tap.pop()
+        if not len(frames):
+            return
+        count = len(frames)
+        self.frames_metered += count
+
+        peak = np.abs(frames).max(axis=0)
+        true_peak = np.abs(self.oversampler.process(frames, count * self.oversampler.up)).max(axis=0)
+        self.max_peak = np.maximum(self.max_peak, peak)
+        self.max_true_peak = np.maximum(self.max_true_peak, true_peak)
+        self.clipped += np.count_nonzero(np.abs(frames) >= 1.0, axis=0)
+
+        # Exponential RMS window, applied once per chunk
+        decay = np.exp(-count / (self.rms_window * self.sample_rate))
+        self.mean_square = decay * self.mean_square + (1.0 - decay) * np.mean(frames ** 2, axis=0)
+        rms = np.sqrt(self.mean_square)
+
+        levels = {'channels': {}, 'parts': {}}
+        for i, name in enumerate(self.channel_names):
+            levels['channels'][name] = self._level_entry(peak[i], rms[i], true_peak[i],
+                                                         self.max_peak[i], self.max_true_peak[i],
+                                                         self.clipped[i])
+        for name, columns in self.parts.items():
+            levels['parts'][name] = self._level_entry(
+                peak[columns].max(), np.sqrt(np.mean(self.mean_square[columns])), true_peak[columns].max(),
+                self.max_peak[columns].max(), self.max_true_peak[columns].max(), self.clipped[columns].sum())
+        self.levels = levels
+
+        part_signals = np.stack([frames[:, columns].mean(axis=1) for columns in self.parts.values()], axis=1)
+        self.history = np.concatenate([self.history, part_signals])[-self.fft_size:]
+        now = time.perf_counter()
+        if now - self._last_spectrum >= self.spectrum_interval:
+            self._last_spectrum = now
+            self._update_spectra()
+
+    def _level_entry(self, peak, rms, true_peak, max_peak, max_true_peak, clipped):
+        return {
+            'peak_db': to_db(peak),
+            'rms_db': to_db(rms),
+            'true_peak_db': to_db(true_peak),
+            'max_peak_db': to_db(max_peak),
+            'max_true_peak_db': to_db(max_true_peak),
+            'clipped_samples': int(clipped),
+        }
+
+    def _update_spectra(self):
+        magnitudes = np.abs(np.fft.rfft(self.history * self.window[:, None], axis=0))
+        magnitudes *= 2.0 / self.window.sum()
+        spectra_db = 20.0 * np.log10(np.maximum(magnitudes, 1e-6))
+        self.spectra = {name: spectra_db[:, i] for i, name in enumerate(self.parts)}
+
+    def get_levels(self):
+        """{'channels': {name: entry}, 'parts': {name: entry}} with levels in dBFS"""
+        return self.levels
+
+    def get_spectrum(self, part='main'):
+        """(frequencies in Hz, magnitudes in dBFS) of part's latest spectrum, or None before the first"""
+        spectrum = self.spectra.get(part)
+        return None if spectrum is None else (self.frequencies, spectrum)
+
+    def get_stats(self):
+        return {
+            'frames_metered': self.frames_metered,
+            'frames_dropped': self.tap.dropped,
+            'update_rate': self.update_rate,
+            'spectrum_rate': 1.0 / self.spectrum_interval,
+            'fft_size': self.fft_size,
+        }
+
+    def to_json(self, spectrum_bands=0, indent=2):
+        """Levels and stats as JSON; spectrum_bands > 0 adds each part's spectrum in that many log-spaced bands"""
+        result = {'levels': self.get_levels(), 'stats': self.get_stats()}
+        if spectrum_bands and self.spectra:
+            edges = np.geomspace(20.0, self.sample_rate / 2, spectrum_bands + 1)
+            bins = np.clip(np.searchsorted(self.frequencies, edges), 1, len(self.frequencies) - 1)
+            result['spectrum'] = {
+                'band_edges_hz': edges.tolist(),
+                'parts': {name: [float(spectrum[lo:max(hi, lo + 1)].max()) for lo, hi in zip(bins[:-1], bins[1:])]
+                          for name, spectrum in self.spectra.items()},
+            }
+        return json.dumps(result, indent=indent)
@@ -1,6 +1,9 @@
 
+import asyncio
+import threading
 import mido
 from collections import deque
+from midi_sources import AsyncMIDIInput
 
 class MockMIDIInput:
     def __init__(self):
@@ -32,6 +35,43 @@ class MIDIHandler:
         self.midi_in = MockMIDIInput()
         self.midi_in.set_callback(callback)
         self.is_mock = True
+        self.async_input = None
+        self._async_loop = None
+        self._async_task = None
+        self._async_thread = None
+
+    def start_async_input(self, sources, max_pending=256, merge_window=0.002):
+        """Merge MIDISources (ports, files, sockets...) into the callback on a background event loop"""
+        self.stop_async_input()
+        self.async_input = AsyncMIDIInput(self.callback, max_pending, merge_window)
+        for source in sources:
+            self.async_input.add_source(source)
+
+        ready = threading.Event()
+
+        def run_loop():
+            self._async_loop = asyncio.new_event_loop()
+            self._async_task = self._async_loop.create_task(self.async_input.run())
+            ready.set()
+            try:
+                self._async_loop.run_until_complete(self._async_task)
+            except asyncio.CancelledError:
+                pass
+            finally:
+                self._async_loop.close()
+
+        self._async_thread = threading.Thread(target=run_loop, name="midi-async-input", daemon=True)
+        self._async_thread.start()
+        ready.wait()
+        return self.async_input
+
+    def stop_async_input(self):
+        if self._async_thread is None:
+            return
+        if self._async_thread.is_alive():
+            self._async_loop.call_soon_threadsafe(self._async_task.cancel)
+        self._async_thread.join(timeout=2.0)
+        self._async_thread = None
             
     def send_test_note_on(self, note, velocity=64, channel=1):
         if isinstance(self.midi_in, MockMIDIInput):
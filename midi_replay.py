@@ -0,0 +1,311 @@
+"""Capture and replay of MIDI traffic for reproducible load testing.
+
+Capture logs are a small header followed by one record per message:
+
+    header   b'IMLG', uint16 version
+    record   uint32 nanoseconds since the previous record, uint8 length, raw bytes
+
+A record with length 0 only advances the clock (for gaps longer than a
+uint32 of nanoseconds, about 4.3 s). All integers are little-endian.
+
+    python midi_replay.py replay session.imlog --speed 4     # 4x realtime
+    python midi_replay.py replay session.imlog --asap        # as fast as possible
+    python midi_replay.py generate cluster -o chords.imlog --rate 20 --notes 8
+    python midi_replay.py generate pedal --duration 60 --replay --asap
+"""
+import asyncio
+import struct
+import threading
+import time
+import numpy as np
+from midi_sources import MIDISource
+
+LOG_MAGIC = b'IMLG'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<4sH')
+RECORD = struct.Struct('<IB')
+MAX_DELTA_NS = 0xFFFFFFFF
+
+def write_log(path, events):
+    """Write [(seconds, [status, data...]), ...] (sorted by time) as a capture log"""
+    with open(path, 'wb') as f:
+        f.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+        last_ns = 0
+        for when, message in events:
+            now_ns = int(round(when * 1e9))
+            last_ns = _write_record(f, now_ns - last_ns, bytes(message)) + last_ns
+    return len(events)
+
+def _write_record(f, delta_ns, data):
+    """Write one record, splitting long gaps; returns the nanoseconds written"""
+    delta_ns = max(0, delta_ns)
+    written = delta_ns
+    while delta_ns > MAX_DELTA_NS:
+        f.write(RECORD.pack(MAX_DELTA_NS, 0))
+        delta_ns -= MAX_DELTA_NS
+    f.write(RECORD.pack(delta_ns, len(data)) + data)
+    return written
+
+def read_log(path):
+    """Capture log -> [(seconds since capture start, [status, data...]), ...]"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version = LOG_HEADER.unpack_from(data)
+    if magic != LOG_MAGIC:
+        raise ValueError(f"{path} is not a MIDI capture log")
+    if version > LOG_VERSION:
+        raise ValueError(f"{path} is capture log version {version}; this build reads up to {LOG_VERSION}")
+
+    events = []
+    offset = LOG_HEADER.size
+    clock_ns = 0
+    while offset < len(data):
+        delta_ns, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        clock_ns += delta_ns
+        if length:
+            events.append((clock_ns / 1e9, list(data[offset:offset + length])))
+            offset += length
+    return events
+
+class MIDICapture:
+    """Logs every message passed to record() with a perf_counter_ns timestamp"""
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+        self.messages = 0
+        self._lock = threading.Lock()  # Messages can arrive from device and async input threads
+        self._last_ns = None
+
+    def record(self, message, timestamp_ns=None):
+        now_ns = timestamp_ns if timestamp_ns is not None else time.perf_counter_ns()
+        with self._lock:
+            if self.file is None:
+                return
+            delta_ns = 0 if self._last_ns is None else now_ns - self._last_ns
+            self._last_ns = now_ns
+            _write_record(self.file, delta_ns, bytes(message))
+            self.messages += 1
+
+    def wrap(self, callback):
+        """callback(message, timestamp) that records each message before passing it on"""
+        def capture(message, timestamp):
+            self.record(message)
+            return callback(message, timestamp)
+        return capture
+
+    def close(self):
+        with self._lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        print(f"Captured {self.messages} MIDI messages to {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class LogSource(MIDISource):
+    """Plays a capture log (or an event list) into AsyncMIDIInput at speed x realtime"""
+    def __init__(self, log, speed=1.0, loop=False):
+        super().__init__()
+        self.log_events = read_log(log) if isinstance(log, str) else log
+        self.speed = speed
+        self.loop = loop
+        self.name = f"log:{log}" if isinstance(log, str) else 'log'
+
+    async def events(self):
+        while True:
+            start = time.perf_counter()
+            for when, message in self.log_events:
+                when = start + when / self.speed
+                delay = when - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.received += 1
+                yield when, list(message)
+            if not self.loop:
+                return
+
+# Synthetic stress profiles: each returns a sorted [(seconds, message), ...] list
+
+def cluster_profile(duration=10.0, rate=10.0, notes=8, hold=0.25, low=36, high=96, velocity=100, seed=0):
+    """rate clusters per second of notes simultaneous note-ons, each held for hold seconds"""
+    rng = np.random.default_rng(seed)
+    events = []
+    for start in np.arange(0.0, duration, 1.0 / rate):
+        root = int(rng.integers(low, max(low + 1, high - 12)))
+        chord = np.unique(root + rng.integers(0, 24, notes)).clip(0, 127)
+        for note in chord:
+            events.append((start, [0x90, int(note), velocity]))
+            events.append((start + hold, [0x80, int(note), 0]))
+    return sorted(events, key=lambda e: e[0])
+
+def pedal_profile(duration=10.0, rate=20.0, pedal_period=2.0, low=36, high=96, seed=0):
+    """Sustain-pedal pileup: rate notes per second held down until the pedal lifts every pedal_period"""
+    rng = np.random.default_rng(seed)
+    events = []
+    for pedal_down in np.arange(0.0, duration, pedal_period):
+        pedal_up = min(duration, pedal_down + pedal_period) - 1e-3
+        events.append((pedal_down, [0xB0, 64, 127]))
+        held = set()
+        for when in np.arange(pedal_down, pedal_up, 1.0 / rate):
+            note = int(rng.integers(low, high))
+            events.append((when, [0x90, note, int(rng.integers(40, 128))]))
+            held.add(note)
+        # The engine has no pedal; the pileup is the notes it keeps sounding until the pedal lifts
+        events.append((pedal_up, [0xB0, 64, 0]))
+        events.extend((pedal_up, [0x80, note, 0]) for note in sorted(held))
+    return sorted(events, key=lambda e: e[0])
+
+def cc_sweep_profile(duration=10.0, rate=500.0, controls=(73, 74, 75, 76), sweep_period=0.5,
+                     notes=(48, 55, 60, 64)):
+    """Held chord under CC sweeps: rate messages per second spread over controls"""
+    events = [(0.0, [0x90, note, 100]) for note in notes]
+    for i, when in enumerate(np.arange(0.0, duration, 1.0 / rate)):
+        control = controls[i % len(controls)]
+        value = int(round(63.5 + 63.5 * np.sin(2.0 * np.pi * when / sweep_period)))
+        events.append((when, [0xB0, control, value]))
+    events.extend((duration, [0x80, note, 0]) for note in notes)
+    return sorted(events, key=lambda e: e[0])
+
+PROFILES = {
+    'cluster': cluster_profile,
+    'pedal': pedal_profile,
+    'cc': cc_sweep_profile,
+}
+
+class LoadReplayer:
+    """Feeds an event list through handler(message, timestamp) while rendering blocks.
+
+    Events due within a block are dispatched before it is rendered. With
+    speed set, blocks are paced against the wall clock at speed x realtime
+    (1.0 plays the capture as recorded); speed=None renders as fast as
+    possible. Render times are kept per block for the statistics.
+    """
+    def __init__(self, handler, render, sample_rate=44100, block_size=256):
+        self.handler = handler
+        self.render = render
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.render_times = np.empty(0)
+        self.events_per_block = np.empty(0, dtype=np.int64)
+        self.wall_time = 0.0
+        self.speed = None
+
+    def run(self, events, speed=1.0, tail=1.0):
+        """Replay events, then render tail seconds more so releases finish"""
+        self.speed = speed
+        period = self.block_size / self.sample_rate
+        duration = (events[-1][0] if events else 0.0) + tail
+        blocks = int(np.ceil(duration / period))
+        self.render_times = np.empty(blocks)
+        self.events_per_block = np.zeros(blocks, dtype=np.int64)
+
+        start = time.perf_counter()
+        next_event = 0
+        for block in range(blocks):
+            block_end = (block + 1) * period
+            if speed:
+                delay = start + block * period / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            first = next_event
+            while next_event < len(events) and events[next_event][0] < block_end:
+                when, message = events[next_event]
+                self.handler(message, start + when / speed if speed else None)
+                next_event += 1
+            self.events_per_block[block] = next_event - first
+
+            t0 = time.perf_counter()
+            self.render(self.block_size)
+            self.render_times[block] = time.perf_counter() - t0
+        self.wall_time = time.perf_counter() - start
+        return self.get_stats()
+
+    def get_stats(self):
+        times = self.render_times
+        deadline = self.block_size / self.sample_rate
+        audio_time = len(times) * deadline
+        busiest = int(np.argmax(times)) if len(times) else 0
+        return {
+            'speed': self.speed or 'asap',
+            'blocks': len(times),
+            'events': int(self.events_per_block.sum()),
+            'max_events_per_block': int(self.events_per_block.max()) if len(times) else 0,
+            'audio_seconds': audio_time,
+            'wall_seconds': self.wall_time,
+            'realtime_factor': audio_time / times.sum() if times.sum() else 0.0,
+            'mean_render_ms': float(times.mean() * 1000) if len(times) else 0.0,
+            'p99_render_ms': float(np.percentile(times, 99) * 1000) if len(times) else 0.0,
+            'max_render_ms': float(times.max() * 1000) if len(times) else 0.0,
+            'slowest_block_time': busiest * deadline,
+            'deadline_ms': deadline * 1000,
+            'deadline_misses': int(np.count_nonzero(times > deadline)),
+        }
+
+def print_stats(stats):
+    print("\nReplay Statistics:")
+    print("-----------------")
+    print(f"Speed: {stats['speed']}")
+    print(f"Events: {stats['events']} ({stats['max_events_per_block']} max in one block)")
+    print(f"Audio: {stats['audio_seconds']:.1f} s in {stats['blocks']} blocks "
+          f"({stats['wall_seconds']:.1f} s wall)")
+    print(f"Throughput: {stats['realtime_factor']:.1f}x realtime")
+    print(f"Render time: {stats['mean_render_ms']:.3f} ms mean, {stats['p99_render_ms']:.3f} ms p99, "
+          f"{stats['max_render_ms']:.3f} ms max at {stats['slowest_block_time']:.2f} s "
+          f"(deadline {stats['deadline_ms']:.2f} ms)")
+    print(f"Deadline misses: {stats['deadline_misses']}")
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from voice_manager import VoiceManager
+
+    parser = argparse.ArgumentParser(description="Replay captured or synthetic MIDI load against the engine")
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay_cmd = commands.add_parser('replay', help="Replay a capture log")
+    replay_cmd.add_argument('log')
+    generate_cmd = commands.add_parser('generate', help="Generate a synthetic stress profile")
+    generate_cmd.add_argument('profile', choices=sorted(PROFILES))
+    generate_cmd.add_argument('-o', '--output', help="Write the profile as a capture log")
+    generate_cmd.add_argument('--duration', type=float, default=10.0)
+    generate_cmd.add_argument('--rate', type=float, help="Clusters, notes or CC messages per second")
+    generate_cmd.add_argument('--notes', type=int, help="Notes per cluster (cluster profile)")
+    generate_cmd.add_argument('--seed', type=int, default=0)
+    generate_cmd.add_argument('--replay', action='store_true', help="Replay the generated profile")
+    for command in (replay_cmd, generate_cmd):
+        command.add_argument('--speed', type=float, default=1.0, help="Multiple of realtime (default 1)")
+        command.add_argument('--asap', action='store_true', help="Render as fast as possible")
+        command.add_argument('--sample-rate', type=int, default=44100)
+        command.add_argument('--block-size', type=int, default=256)
+        command.add_argument('--max-voices', type=int, default=16)
+        command.add_argument('--json', action='store_true', help="Print statistics as JSON")
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        events = read_log(args.log)
+    else:
+        options = {'duration': args.duration, **({'seed': args.seed} if args.profile != 'cc' else {})}
+        if args.rate is not None:
+            options['rate'] = args.rate
+        if args.notes is not None and args.profile == 'cluster':
+            options['notes'] = args.notes
+        events = PROFILES[args.profile](**options)
+        if args.output:
+            write_log(args.output, events)
+            print(f"Wrote {len(events)} events to {args.output}")
+        if not args.replay:
+            raise SystemExit(0)
+
+    voice_manager = VoiceManager(args.sample_rate, args.max_voices, verbose=False)
+    replayer = LoadReplayer(voice_manager.handle_midi_message, voice_manager.get_audio_block,
+                            args.sample_rate, args.block_size)
+    stats = replayer.run(events, None if args.asap else args.speed)
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print_stats(stats)
@@ -0,0 +1,292 @@
+import abc
+import asyncio
+import heapq
+import itertools
+import time
+import mido
+
+def _message_length(status):
+    """Total bytes in a channel/system common message starting with status"""
+    kind = status & 0xF0
+    if kind in (0xC0, 0xD0):
+        return 2
+    if kind < 0xF0:
+        return 3
+    return {0xF1: 2, 0xF2: 3, 0xF3: 2}.get(status, 1)
+
+class MIDIByteParser:
+    """Splits a raw MIDI byte stream (with running status) into messages; SysEx is skipped"""
+    def __init__(self):
+        self.running_status = None
+        self.pending = []
+        self.in_sysex = False
+
+    def feed(self, data):
+        messages = []
+        for byte in data:
+            if byte >= 0xF8:  # Realtime bytes can appear anywhere
+                messages.append([byte])
+                continue
+            if byte == 0xF0:
+                self.in_sysex = True
+                continue
+            if self.in_sysex:
+                if not byte & 0x80:
+                    continue
+                self.in_sysex = False  # F7 or any other status byte ends SysEx
+                if byte == 0xF7:
+                    continue
+            if byte & 0x80:
+                self.pending = [byte]
+                self.running_status = byte if byte < 0xF0 else None
+            elif not self.pending:
+                if self.running_status is None:
+                    continue
+                self.pending = [self.running_status, byte]
+            else:
+                self.pending.append(byte)
+
+            if self.pending and len(self.pending) == _message_length(self.pending[0]):
+                messages.append(self.pending)
+                self.pending = []
+        return messages
+
+class MIDISource(abc.ABC):
+    """Base class: an async iterator of (timestamp, [status, data...]) events.
+
+    Timestamps are time.perf_counter() seconds so events from every source
+    share one clock.
+    """
+    name = 'source'
+
+    def __init__(self):
+        self.received = 0
+        self.dropped = 0
+
+    def __aiter__(self):
+        return self.events()
+
+    @abc.abstractmethod
+    async def events(self):
+        """Async generator yielding (timestamp, message) until the source is exhausted"""
+
+class QueuedSource(MIDISource):
+    """Source fed from outside the event loop, with a bounded buffer that drops when full"""
+    def __init__(self, max_pending=1024):
+        super().__init__()
+        self.max_pending = max_pending
+        self.loop = None
+        self.queue = None
+
+    def push(self, message, timestamp=None):
+        """Thread-safe: call from driver callbacks"""
+        timestamp = time.perf_counter() if timestamp is None else timestamp
+        if self.loop is None:
+            self.dropped += 1
+            return
+        self.loop.call_soon_threadsafe(self._put, (timestamp, list(message)))
+
+    def _put(self, event):
+        if self.queue.full():
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(event)
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def events(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(self.max_pending)
+        await self.open()
+        try:
+            while True:
+                event = await self.queue.get()
+                self.received += 1
+                yield event
+        finally:
+            await self.close()
+
+class MidoPortSource(QueuedSource):
+    """A hardware or virtual MIDI input port opened through mido"""
+    def __init__(self, port_name=None, max_pending=1024):
+        super().__init__(max_pending)
+        self.port_name = port_name
+        self.name = f"port:{port_name or 'default'}"
+        self.port = None
+
+    async def open(self):
+        self.port = mido.open_input(self.port_name, callback=lambda msg: self.push(msg.bytes()))
+
+    async def close(self):
+        if self.port is not None:
+            self.port.close()
+            self.port = None
+
+class MidiFileSource(MIDISource):
+    """Plays a standard MIDI file, stamping events with their scheduled times"""
+    def __init__(self, path, speed=1.0, loop=False):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.name = f"file:{path}"
+
+    async def events(self):
+        midi_file = mido.MidiFile(self.path)
+        while True:
+            start = time.perf_counter()
+            elapsed = 0.0
+            for msg in midi_file:
+                elapsed += msg.time / self.speed
+                if msg.is_meta:
+                    continue
+                when = start + elapsed
+                delay = when - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.received += 1
+                yield when, msg.bytes()
+            if not self.loop:
+                return
+
+class VirtualSource(MIDISource):
+    """Scripted events for tests: [(delay_seconds, [status, data...]), ...]"""
+    def __init__(self, script, name='virtual'):
+        super().__init__()
+        self.script = script
+        self.name = name
+
+    async def events(self):
+        when = time.perf_counter()
+        for delay, message in self.script:
+            when += delay
+            wait = when - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.received += 1
+            yield when, list(message)
+
+class SocketSource(QueuedSource):
+    """Raw MIDI bytes from local clients over TCP (host, port) or a Unix socket path"""
+    def __init__(self, port=None, host='127.0.0.1', path=None, max_pending=1024):
+        super().__init__(max_pending)
+        self.host = host
+        self.port = port
+        self.path = path
+        self.name = f"socket:{path or f'{host}:{port}'}"
+        self.server = None
+
+    async def _handle_client(self, reader, writer):
+        parser = MIDIByteParser()
+        try:
+            while data := await reader.read(1024):
+                now = time.perf_counter()
+                for message in parser.feed(data):
+                    self._put((now, message))
+        finally:
+            writer.close()
+
+    async def open(self):
+        if self.path:
+            self.server = await asyncio.start_unix_server(self._handle_client, self.path)
+        else:
+            self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+class AsyncMIDIInput:
+    """Merges several MIDISources in timestamp order into one engine callback.
+
+    Events wait in a bounded heap for merge_window seconds so small jitter
+    between sources is reordered. A full heap applies backpressure to
+    sources that can wait (files, scripts). Buffered live sources instead
+    drop and count events once their own buffer fills.
+    """
+    def __init__(self, callback, max_pending=256, merge_window=0.002):
+        self.callback = callback
+        self.max_pending = max_pending
+        self.merge_window = merge_window
+        self.sources = []
+        self.dispatched = 0
+        self.reordered = 0
+
+        self._heap = []
+        self._sequence = itertools.count()
+        self._last_dispatched = float('-inf')
+        self._changed = None
+        self._space = None
+
+    def add_source(self, source):
+        self.sources.append(source)
+        return source
+
+    async def _pump(self, source):
+        async for timestamp, message in source:
+            while len(self._heap) >= self.max_pending:
+                self._space.clear()
+                await self._space.wait()
+            heapq.heappush(self._heap, (timestamp, next(self._sequence), message))
+            self._changed.set()
+
+    async def _dispatch(self, pumps):
+        while self._heap or not all(p.done() for p in pumps):
+            if not self._heap:
+                self._changed.clear()
+                await self._wait_changed(pumps)
+                continue
+            timestamp = self._heap[0][0]
+            hold = timestamp + self.merge_window - time.perf_counter()
+            if hold > 0 and not all(p.done() for p in pumps):
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), hold)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            timestamp, _, message = heapq.heappop(self._heap)
+            self._space.set()
+            if timestamp < self._last_dispatched:
+                self.reordered += 1  # Arrived later than the merge window allowed for
+            self._last_dispatched = max(self._last_dispatched, timestamp)
+            self.dispatched += 1
+            self.callback(message, timestamp)
+
+    async def _wait_changed(self, pumps):
+        waiter = asyncio.ensure_future(self._changed.wait())
+        try:
+            await asyncio.wait([waiter, *[p for p in pumps if not p.done()]],
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+
+    async def run(self):
+        """Run until every source is exhausted (live sources run until cancelled)"""
+        self._changed = asyncio.Event()
+        self._space = asyncio.Event()
+        pumps = [asyncio.create_task(self._pump(source)) for source in self.sources]
+        try:
+            await self._dispatch(pumps)
+        finally:
+            for pump in pumps:
+                pump.cancel()
+            results = await asyncio.gather(*pumps, return_exceptions=True)
+            for source, result in zip(self.sources, results):
+                if isinstance(result, Exception):
+                    print(f"Warning: MIDI source {source.name} failed: {result}")
+
+    def get_stats(self):
+        return {
+            'dispatched': self.dispatched,
+            'pending': len(self._heap),
+            'reordered': self.reordered,
+            'sources': {source.name: {'received': source.received, 'dropped': source.dropped}
+                        for source in self.sources},
+        }
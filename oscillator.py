@@ -1,38 +1,245 @@
 import numpy as np
 
+# Band-limited variant -> the naive waveform it corrects
+BAND_LIMITED = {'blep_saw': 'sawtooth', 'blep_triangle': 'triangle', 'blep_pulse': 'pulse'}
+WAVEFORMS = ['sine', 'sawtooth', 'triangle', 'pulse'] + list(BAND_LIMITED)
+
+def render_waveform(wave_type, phases, increment=None):
+    """Evaluate a waveform over an array of phases (radians) of any shape.
+
+    Band-limited types also need the phase increment per sample (a scalar,
+    or one per row of a 2-D phases array) and linear phases along the last axis.
+    """
+    if wave_type in BAND_LIMITED:
+        return render_band_limited(wave_type, phases, increment)
+    if wave_type == 'sine':
+        return np.sin(phases)
+    elif wave_type == 'sawtooth':
+        return 2.0 * (phases / (2.0 * np.pi) - np.floor(0.5 + phases / (2.0 * np.pi)))
+    elif wave_type == 'triangle':
+        return 2.0 * np.abs(2.0 * (phases / (2.0 * np.pi) - np.floor(0.5 + phases / (2.0 * np.pi)))) - 1.0
+    else:  # pulse
+        return np.where(np.sin(phases) >= 0, 1.0, -1.0)
+
+def _apply_corrections(samples, start, dt, offset, spacing, height, residual, alternate=False):
+    """Add height * residual around every discontinuity of rows of linear phase runs.
+
+    samples is (rows, frames + 3): each run padded with one slot before and
+    two after it. start and dt are each row's first cycle position and cycles
+    per sample. Discontinuities sit at cycle positions offset + j * spacing,
+    with alternating sign from even to odd j when alternate is set. Their
+    sample positions follow directly from start and dt, so there is no
+    per-sample search and only the two samples around each one are touched.
+    Corrections that belong to the neighbouring blocks land in the padding.
+    """
+    rows, frames = samples.shape[0], samples.shape[1] - 3
+    first = np.floor((start - offset - dt) / spacing) + 1
+    j = first[:, None] + np.arange(int(frames * dt.max() / spacing) + 2)
+    x = (j * spacing + (offset - start)[:, None]) / dt[:, None]  # fractional sample positions
+    after = np.ceil(x)
+    post, pre = residual(after - x)  # 0 <= after - x < 1 samples since the discontinuity
+
+    # Slot after + 1 follows the discontinuity, slot after precedes it; past the end goes to scratch
+    index = np.minimum(after, frames + 1).astype(np.intp)
+    if rows > 1:
+        index += np.arange(0, rows * (frames + 3), frames + 3)[:, None]
+    if alternate:
+        height = height * (1.0 - 2.0 * (j % 2))
+    flat = samples.reshape(-1)
+    flat[index + 1] += height * post
+    flat[index] += height * pre
+
+def _poly_blep(t):
+    """Band-limited minus naive unit step on the samples t and t - 1 after it (0 <= t < 1)"""
+    return -0.5 * (1.0 - t) ** 2, 0.5 * t * t
+
+def _poly_blamp(t):
+    """Band-limited minus naive unit slope change (one unit per sample); the integral of _poly_blep"""
+    return (1.0 - t) ** 3 / 6.0, t ** 3 / 6.0
+
+def render_band_limited(wave_type, phases, increment):
+    """Naive waveform plus PolyBLEP (steps) or PolyBLAMP (corners) corrections at its discontinuities.
+
+    phases is (frames,) or (rows, frames) of linear phase runs, with one
+    increment per row (or one for all). Assumes increments below Nyquist
+    (at most half a cycle per sample).
+    """
+    phases = np.asarray(phases)
+    frames = phases.shape[-1]
+    padded = np.empty(phases.shape[:-1] + (frames + 3,))
+    padded[..., 1:frames + 1] = render_waveform(BAND_LIMITED[wave_type], phases)
+
+    runs = padded.reshape(-1, frames + 3)
+    start = phases.reshape(-1, frames)[:, 0] / (2.0 * np.pi)
+    dt = np.reshape(increment, -1) / (2.0 * np.pi)
+    if wave_type == 'blep_saw':
+        # Falls from +1 to -1 halfway through the cycle
+        _apply_corrections(runs, start, dt, 0.5, 1.0, -2.0, _poly_blep)
+    elif wave_type == 'blep_pulse':
+        # Rises at the start of the cycle, falls halfway
+        _apply_corrections(runs, start, dt, 0.0, 0.5, 2.0, _poly_blep, alternate=True)
+    else:
+        # Slope flips from -4 to +4 per cycle at the minimum (0) and back at the maximum (0.5)
+        _apply_corrections(runs, start, dt, 0.0, 0.5, 8.0 * dt[:, None], _poly_blamp, alternate=True)
+    return padded[..., 1:frames + 1]
+
 class Oscillator:
     def __init__(self, sample_rate):
         self.sample_rate = sample_rate
         self.phase = 0
         self.freq = 440.0
-        self.types = ['sine', 'sawtooth', 'triangle', 'pulse']
+        self.types = list(WAVEFORMS)
         self.current_type = 0
+        self.prefetched = None  # (block_key, samples, next phase) left by OscillatorBank
 
     def set_frequency(self, freq):
         self.freq = freq
 
     def set_type(self, type_idx):
+        if isinstance(type_idx, str):
+            type_idx = self.types.index(type_idx)
         self.current_type = type_idx % len(self.types)
 
+    def note_on(self):
+        # Single oscillators are free-running; nothing to reset
+        pass
+
+    def block_key(self, num_samples):
+        """Everything a block of num_samples depends on"""
+        return (self.phase, self.freq, self.current_type, self.sample_rate, num_samples)
+
     def get_samples(self, num_samples):
+        prefetched = self.prefetched
+        if prefetched is not None:
+            # Rendered ahead by an OscillatorBank; only valid if nothing changed since
+            self.prefetched = None
+            key, samples, phase = prefetched
+            if key == self.block_key(num_samples):
+                self.phase = phase
+                return samples
+
         phase_increment = 2.0 * np.pi * self.freq / self.sample_rate
         phases = np.linspace(self.phase,
                            self.phase + phase_increment * num_samples,
                            num_samples, endpoint=False)
         
-        if self.types[self.current_type] == 'sine':
-            samples = np.sin(phases)
-        elif self.types[self.current_type] == 'sawtooth':
-            samples = 2.0 * (phases / (2.0 * np.pi) - np.floor(0.5 + phases / (2.0 * np.pi)))
-        elif self.types[self.current_type] == 'triangle':
-            samples = 2.0 * np.abs(2.0 * (phases / (2.0 * np.pi) - np.floor(0.5 + phases / (2.0 * np.pi)))) - 1.0
-        else:  # pulse
-            samples = np.where(np.sin(phases) >= 0, 1.0, -1.0)
+        samples = render_waveform(self.types[self.current_type], phases, phase_increment)
 
         self.phase = phases[-1] + phase_increment
         self.phase %= 2.0 * np.pi
         
         return samples
 
+    def advance(self, num_samples):
+        """Move the phase exactly as get_samples(num_samples) would, without rendering"""
+        phase_increment = 2.0 * np.pi * self.freq / self.sample_rate
+        step = (self.phase + phase_increment * num_samples - self.phase) / num_samples
+        self.phase = (num_samples - 1) * step + self.phase + phase_increment  # linspace's last point
+        self.phase %= 2.0 * np.pi
+
+class OscillatorBank:
+    """Renders one block for many plain Oscillators with one render_waveform call per waveform.
+
+    Per-call numpy overhead dominates short blocks (most of all for the
+    band-limited types), so the rows are rendered together and each is left
+    on its oscillator for the next get_samples call, keyed by the state it was
+    rendered from. An oscillator that doesn't play the block (retired, or its
+    note changed meanwhile) just renders live; the phase only ever moves in
+    get_samples, exactly as it would without the bank.
+    """
+    def __init__(self):
+        self.types = WAVEFORMS
+        self.current_type = 0  # Waveform of the group being rendered (for the profiler)
+        self._ramp = np.arange(0)
+
+    def render(self, oscillators, num_samples):
+        groups = {}
+        for oscillator in oscillators:
+            prefetched = oscillator.prefetched
+            if prefetched is not None and prefetched[0] == oscillator.block_key(num_samples):
+                continue  # Already rendered by another bank this round
+            groups.setdefault(oscillator.current_type, []).append(oscillator)
+        for type_idx, group in groups.items():
+            if len(group) > 1:  # A lone oscillator is cheaper rendered by itself
+                self.current_type = type_idx
+                self.render_group(group, num_samples)
+
+    def render_group(self, oscillators, num_samples):
+        """Render oscillators that share a waveform as rows of one (oscillators, frames) array"""
+        if len(self._ramp) != num_samples:
+            self._ramp = np.arange(num_samples, dtype=float)
+        keys = [oscillator.block_key(num_samples) for oscillator in oscillators]
+        phase = np.array([key[0] for key in keys], dtype=float)
+        freq = np.array([key[1] for key in keys], dtype=float)
+        sample_rate = np.array([key[3] for key in keys], dtype=float)
+
+        # Same arithmetic as Oscillator.get_samples (np.linspace), one row per oscillator
+        increment = 2.0 * np.pi * freq / sample_rate
+        step = (phase + increment * num_samples - phase) / num_samples
+        phases = self._ramp * step[:, None] + phase[:, None]
+        samples = render_waveform(self.types[self.current_type], phases, increment)
+        next_phase = (phases[:, -1] + increment) % (2.0 * np.pi)
+
+        for oscillator, key, row, end in zip(oscillators, keys, samples, next_phase):
+            oscillator.prefetched = (key, row, end)
+
+class UnisonOscillator(Oscillator):
+    """Stack of detuned copies of one waveform, rendered as a (unison, frames) array.
+
+    detune is the outermost voice's offset in cents; voices are spaced evenly
+    between -detune and +detune. spread (0-1) pans the stack across the
+    stereo field with the same spacing.
+    """
+    max_unison = 16
+
+    def __init__(self, sample_rate, unison=7, detune=20.0, spread=0.5, rng=None):
+        super().__init__(sample_rate)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.detune = 20.0
+        self.spread = 0.5
+        self._ramp = np.arange(0)
+        self.set_unison(unison, detune, spread)
+
+    def set_unison(self, unison, detune=None, spread=None):
+        self.unison = int(np.clip(unison, 1, self.max_unison))
+        if detune is not None:
+            self.detune = max(0.0, detune)
+        if spread is not None:
+            self.spread = float(np.clip(spread, 0.0, 1.0))
+
+        offsets = np.linspace(-1.0, 1.0, self.unison) if self.unison > 1 else np.zeros(1)
+        self.ratios = 2.0 ** (offsets * self.detune / 1200.0)
+
+        # Equal-power pan law, one (left, right) gain pair per stacked voice, scaled so
+        # that at spread 0 both sides equal the mono mix (the voice's own pan comes after)
+        angles = (offsets * self.spread + 1.0) * np.pi / 4.0
+        self.gain = 1.0 / np.sqrt(self.unison)
+        self.mono_gains = np.full(self.unison, self.gain)
+        self.stereo_gains = np.stack([np.cos(angles), np.sin(angles)]) * (np.sqrt(2.0) * self.gain)
+
+        self.phases = self.rng.uniform(0.0, 2.0 * np.pi, self.unison)
+
+    def note_on(self):
+        # Random start phases keep the stack from phasing identically on every note
+        self.phases = self.rng.uniform(0.0, 2.0 * np.pi, self.unison)
+
+    def get_stack(self, num_samples):
+        if len(self._ramp) != num_samples:
+            self._ramp = np.arange(num_samples)
+
+        increments = 2.0 * np.pi * self.freq * self.ratios / self.sample_rate
+        phases = self.phases[:, None] + increments[:, None] * self._ramp
+        stack = render_waveform(self.types[self.current_type], phases, increments)
+
+        self.phases = (self.phases + increments * num_samples) % (2.0 * np.pi)
+        return stack
+
+    def get_samples(self, num_samples):
+        return self.mono_gains @ self.get_stack(num_samples)
+
+    def get_stereo_samples(self, num_samples):
+        """(2, frames) left/right mix of the stack using the spread pan gains (used by stereo bus mixes)"""
+        return self.stereo_gains @ self.get_stack(num_samples)
+
 def midi_to_freq(midi_note):
     return 440.0 * (2.0 ** ((midi_note - 69) / 12.0))
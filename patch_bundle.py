@@ -0,0 +1,158 @@
+"""Compiled patch bundles.
+
+A bundle is a directory holding manifest.json (format version, content hash,
+patch parameters, array index) plus one .npy file per precomputed array:
+
+- one_shots:   (notes, frames) unity-velocity renders for percussive
+               (sustain 0) patches, pinned in the render cache outside its
+               LRU budget
+- filter_bank: polyphase resampler bank when the engine and device rates differ
+
+Loading memory-maps the arrays, so startup and patch changes cost a
+manifest read rather than a re-render, and pages are only touched once a
+note actually plays.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+from voice_manager import VoiceManager
+from oscillator import midi_to_freq
+from resampler import PolyphaseResampler, FILTER_BANKS
+
+BUNDLE_VERSION = 1
+ENGINE_SOURCES = ['oscillator.py', 'envelope.py', 'voice_manager.py', 'resampler.py']
+DEFAULT_NOTES = (21, 108)  # A0-C8
+
+def engine_fingerprint():
+    """Hash of the engine sources, so bundles rebuild when the DSP code changes"""
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in ENGINE_SOURCES:
+        with open(os.path.join(here, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def patch_hash(params, sample_rate, block_size, device_rate=None, notes=DEFAULT_NOTES):
+    description = {
+        'version': BUNDLE_VERSION,
+        'engine': engine_fingerprint(),
+        'params': params,
+        'sample_rate': sample_rate,
+        'block_size': block_size,
+        'device_rate': device_rate,
+        'notes': list(notes),
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+def compile_patch(path, params, sample_rate, block_size, device_rate=None, notes=DEFAULT_NOTES):
+    """Render every precomputable array for params and write the bundle to path"""
+    print(f"Compiling patch bundle: {path}")
+    os.makedirs(path, exist_ok=True)
+    arrays = {}
+
+    voice_manager = VoiceManager(sample_rate, 1, verbose=False)
+    voice_manager.apply_patch(params)
+    voice = voice_manager.voices[0]
+    if voice.is_one_shot():
+        voice.cache_block = block_size
+        rows = []
+        for note in range(notes[0], notes[1] + 1):
+            voice.oscillator.set_frequency(midi_to_freq(note))
+            rows.append(voice.render_one_shot())
+        arrays['one_shots'] = np.stack(rows)
+
+    resampler_info = None
+    if device_rate and device_rate != sample_rate:
+        resampler = PolyphaseResampler(sample_rate, device_rate)
+        arrays['filter_bank'] = resampler.bank
+        resampler_info = {'up': resampler.up, 'down': resampler.down, 'taps': resampler.taps}
+
+    index = {}
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+        index[name] = {'file': f"{name}.npy", 'shape': list(array.shape), 'dtype': str(array.dtype)}
+
+    manifest = {
+        'version': BUNDLE_VERSION,
+        'hash': patch_hash(params, sample_rate, block_size, device_rate, notes),
+        'params': params,
+        'sample_rate': sample_rate,
+        'block_size': block_size,
+        'device_rate': device_rate,
+        'notes': list(notes),
+        'resampler': resampler_info,
+        'arrays': index,
+    }
+    # Manifest goes last so a half-written bundle is never mistaken for a valid one
+    tmp = os.path.join(path, 'manifest.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(path, 'manifest.json'))
+    return load_patch(path)
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def load_patch(path):
+    manifest = read_manifest(path)
+    if manifest is None or manifest.get('version') != BUNDLE_VERSION:
+        raise ValueError(f"{path}: missing or incompatible patch bundle")
+    arrays = {name: np.load(os.path.join(path, info['file']), mmap_mode='r')
+              for name, info in manifest['arrays'].items()}
+    return CompiledPatch(path, manifest, arrays)
+
+def load_or_compile(path, params, sample_rate, block_size, device_rate=None, notes=DEFAULT_NOTES):
+    """Load the bundle at path, recompiling it if its hash doesn't match params and engine"""
+    manifest = read_manifest(path)
+    expected = patch_hash(params, sample_rate, block_size, device_rate, notes)
+    if manifest is not None and manifest.get('hash') == expected:
+        return load_patch(path)
+    return compile_patch(path, params, sample_rate, block_size, device_rate, notes)
+
+class CompiledPatch:
+    def __init__(self, path, manifest, arrays):
+        self.path = path
+        self.manifest = manifest
+        self.arrays = arrays
+        self.params = manifest['params']
+        self.hash = manifest['hash']
+
+        resampler = manifest.get('resampler')
+        if resampler and 'filter_bank' in arrays:
+            FILTER_BANKS[(resampler['up'], resampler['down'], resampler['taps'], 0.9, 8.0)] = arrays['filter_bank']
+
+    def apply(self, voice_manager):
+        """Switch voice_manager to this patch; nothing is re-rendered"""
+        voice_manager.apply_patch(self.params)
+        one_shots = self.arrays.get('one_shots')
+        if one_shots is None:
+            return
+        if voice_manager.sample_rate != self.manifest['sample_rate']:
+            return
+        if voice_manager.render_cache is None:
+            voice_manager.enable_render_cache()
+        voice = voice_manager.voices[0]
+        low = self.manifest['notes'][0]
+        block_size = self.manifest['block_size']
+        for row, samples in enumerate(one_shots):
+            voice_manager.render_cache.pin(voice.one_shot_key(low + row, block_size), samples)
+
+class PatchBank:
+    """Named compiled patches; select() is a cheap switch suitable mid-performance"""
+    def __init__(self):
+        self.patches = {}
+        self.current = None
+
+    def add(self, name, patch):
+        self.patches[name] = patch
+
+    def select(self, name, voice_manager):
+        patch = self.patches[name]
+        patch.apply(voice_manager)
+        self.current = name
+        return patch
@@ -0,0 +1,51 @@
+class PolyphonyGovernor:
+    """Adapts the voice limit to measured render load.
+
+    load is render time / block deadline, smoothed over a few blocks. Above
+    high_water the limit drops to shed voices; below low_water it climbs back
+    one voice every recovery_blocks blocks, up to max_voices.
+    """
+    def __init__(self, max_voices, min_voices=1, high_water=0.7, low_water=0.4,
+                 smoothing=0.2, recovery_blocks=20, fade_ms=5.0):
+        self.max_voices = max_voices
+        self.min_voices = max(1, min(min_voices, max_voices))
+        self.high_water = high_water
+        self.low_water = low_water
+        self.smoothing = smoothing
+        self.recovery_blocks = recovery_blocks
+        self.fade_ms = fade_ms
+
+        self.voice_limit = max_voices
+        self.load = 0.0
+        self.peak_load = 0.0
+        self.voices_shed = 0
+        self._calm_blocks = 0
+
+    def update(self, render_time, deadline, sounding):
+        """Feed one block's render time; returns the new voice limit"""
+        block_load = render_time / deadline if deadline > 0 else 0.0
+        self.load += self.smoothing * (block_load - self.load)
+        self.peak_load = max(self.peak_load, block_load)
+
+        if self.load > self.high_water:
+            # Scale down proportionally so one bad spike doesn't take many blocks to recover
+            target = int(sounding * self.high_water / self.load)
+            self.voice_limit = max(self.min_voices, min(self.voice_limit - 1, target))
+            self._calm_blocks = 0
+        elif self.load < self.low_water and self.voice_limit < self.max_voices:
+            self._calm_blocks += 1
+            if self._calm_blocks >= self.recovery_blocks:
+                self.voice_limit += 1
+                self._calm_blocks = 0
+        else:
+            self._calm_blocks = 0
+        return self.voice_limit
+
+    def get_stats(self):
+        return {
+            'voice_limit': self.voice_limit,
+            'max_voices': self.max_voices,
+            'load': self.load,
+            'peak_load': self.peak_load,
+            'voices_shed': self.voices_shed,
+        }
@@ -0,0 +1,190 @@
+import json
+import time
+import tracemalloc
+import numpy as np
+
+class StageProfiler:
+    """Opt-in per-stage timing for the render path.
+
+    enable() swaps timed wrappers onto the registered methods at class level and
+    disable() puts the originals back, so a disabled profiler costs nothing at all.
+    Stage times are exclusive (time spent in nested instrumented stages is
+    subtracted) and accumulate into counters allocated up front.
+    """
+    stages = ['render', 'mix', 'oscillator', 'envelope', 'resample', 'output']
+
+    def __init__(self):
+        self.enabled = False
+        self.audit_allocations = False
+        self.targets = []
+        self.originals = []
+        self.waveforms = ['sine', 'sawtooth', 'triangle', 'pulse', 'blep_saw', 'blep_triangle', 'blep_pulse',
+                          'sampler', 'fm', 'other']
+
+        self._stage_index = {name: i for i, name in enumerate(self.stages)}
+        self._waveform_index = {name: i for i, name in enumerate(self.waveforms)}
+        self.calls = np.zeros(len(self.stages), dtype=np.int64)
+        self.total_ns = np.zeros(len(self.stages), dtype=np.int64)
+        self.max_ns = np.zeros(len(self.stages), dtype=np.int64)
+        self.waveform_calls = np.zeros(len(self.waveforms), dtype=np.int64)
+        self.waveform_ns = np.zeros(len(self.waveforms), dtype=np.int64)
+        self._child_ns = 0
+
+        self._audit_depth = 0
+        self._audit_start = 0
+        self.alloc_blocks = 0
+        self.alloc_blocks_with_allocations = 0
+        self.alloc_bytes_total = 0
+        self.alloc_bytes_max = 0
+
+    def register(self, cls, method_name, stage, waveform=None, audit=False):
+        """Instrument cls.method_name as stage when enabled.
+
+        waveform(obj) -> label attributes oscillator time to a waveform type.
+        audit marks a callback entry point for allocation auditing.
+        """
+        self.targets.append((cls, method_name, stage, waveform, audit))
+
+    def enable(self, audit_allocations=False):
+        if self.enabled:
+            self.disable()
+        self.audit_allocations = audit_allocations
+        if audit_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        for cls, name, stage, waveform, audit in self.targets:
+            original = cls.__dict__[name]
+            self.originals.append((cls, name, original))
+            setattr(cls, name, self._wrap(original, stage, waveform, audit and audit_allocations))
+        self.enabled = True
+
+    def disable(self):
+        for cls, name, original in reversed(self.originals):
+            setattr(cls, name, original)
+        self.originals = []
+        if self.audit_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.audit_allocations = False
+        self.enabled = False
+
+    def reset(self):
+        for counter in (self.calls, self.total_ns, self.max_ns, self.waveform_calls, self.waveform_ns):
+            counter.fill(0)
+        self.alloc_blocks = 0
+        self.alloc_blocks_with_allocations = 0
+        self.alloc_bytes_total = 0
+        self.alloc_bytes_max = 0
+
+    def _wrap(self, func, stage, waveform, audit):
+        index = self._stage_index[stage]
+        profiler = self
+
+        def timed(obj, *args, **kwargs):
+            return profiler._timed(index, waveform, audit, func, (obj,) + args, kwargs)
+
+        timed.__wrapped__ = func
+        timed.__name__ = func.__name__
+        return timed
+
+    def call(self, stage, func, *args, audit=False):
+        """Run func(*args) timed as stage.
+
+        For entry points that are handed out as bound methods (stream callbacks)
+        before profiling may start: they check their own flag and call this
+        instead of relying on the class-level swap.
+        """
+        return self._timed(self._stage_index[stage], None, audit and self.audit_allocations, func, args, {})
+
+    def _timed(self, index, waveform, audit, func, args, kwargs):
+        if audit:
+            self._audit_enter()
+        start = time.perf_counter_ns()
+        saved_child = self._child_ns
+        self._child_ns = 0
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            exclusive = elapsed - self._child_ns
+            self._child_ns = saved_child + elapsed
+            self.calls[index] += 1
+            self.total_ns[index] += exclusive
+            if exclusive > self.max_ns[index]:
+                self.max_ns[index] = exclusive
+            if waveform is not None:
+                slot = self._waveform_index.get(waveform(args[0]), len(self.waveforms) - 1)
+                self.waveform_calls[slot] += 1
+                self.waveform_ns[slot] += exclusive
+            if audit:
+                self._audit_exit()
+
+    def _audit_enter(self):
+        # Only the outermost callback entry is audited
+        self._audit_depth += 1
+        if self._audit_depth == 1:
+            tracemalloc.reset_peak()
+            self._audit_start = tracemalloc.get_traced_memory()[0]
+
+    def _audit_exit(self):
+        self._audit_depth -= 1
+        if self._audit_depth == 0:
+            # Peak above the starting point = bytes allocated inside the callback,
+            # including temporaries that were freed again before it returned
+            allocated = tracemalloc.get_traced_memory()[1] - self._audit_start
+            self.alloc_blocks += 1
+            if allocated > 0:
+                self.alloc_blocks_with_allocations += 1
+                self.alloc_bytes_total += allocated
+                self.alloc_bytes_max = max(self.alloc_bytes_max, allocated)
+
+    def snapshot(self):
+        stages = {}
+        for name, i in self._stage_index.items():
+            calls = int(self.calls[i])
+            stages[name] = {
+                'calls': calls,
+                'total_ms': self.total_ns[i] / 1e6,
+                'mean_us': self.total_ns[i] / calls / 1e3 if calls else 0.0,
+                'max_us': self.max_ns[i] / 1e3,
+            }
+        waveforms = {}
+        for name, i in self._waveform_index.items():
+            calls = int(self.waveform_calls[i])
+            if calls:
+                waveforms[name] = {
+                    'calls': calls,
+                    'total_ms': self.waveform_ns[i] / 1e6,
+                    'mean_us': self.waveform_ns[i] / calls / 1e3,
+                }
+        result = {'enabled': self.enabled, 'stages': stages, 'waveforms': waveforms}
+        if self.alloc_blocks:
+            result['allocations'] = {
+                'blocks': self.alloc_blocks,
+                'blocks_with_allocations': self.alloc_blocks_with_allocations,
+                'mean_bytes': self.alloc_bytes_total / self.alloc_blocks,
+                'max_bytes': self.alloc_bytes_max,
+            }
+        return result
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), indent=indent)
+
+def _oscillator_waveform(oscillator):
+    return oscillator.types[oscillator.current_type]
+
+profiler = StageProfiler()
+
+def _register_engine():
+    from oscillator import Oscillator, OscillatorBank, UnisonOscillator
+    from envelope import ADSREnvelope
+    from voice_manager import VoiceManager
+    from resampler import PolyphaseResampler
+
+    profiler.register(Oscillator, 'get_samples', 'oscillator', waveform=_oscillator_waveform)
+    profiler.register(OscillatorBank, 'render_group', 'oscillator', waveform=_oscillator_waveform)
+    profiler.register(UnisonOscillator, 'get_samples', 'oscillator', waveform=_oscillator_waveform)
+    profiler.register(UnisonOscillator, 'get_stereo_samples', 'oscillator', waveform=_oscillator_waveform)
+    profiler.register(ADSREnvelope, 'get_envelope', 'envelope')
+    profiler.register(VoiceManager, 'mix_voices', 'mix', audit=True)
+    profiler.register(PolyphaseResampler, 'pull', 'resample', audit=True)
+
+_register_engine()
@@ -0,0 +1,218 @@
+"""Frozen reference renderer.
+
+A verbatim copy of the original Oscillator / ADSREnvelope / Voice /
+VoiceManager render path (console printing removed; segment lengths clamped
+at zero so shortening a stage mid-segment no longer crashes). Optimized engines are
+checked against it by equivalence.py. Do not optimize or otherwise change
+this file; it is the definition of how the synth is supposed to sound.
+"""
+import numpy as np
+
+class ReferenceOscillator:
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.phase = 0
+        self.freq = 440.0
+        self.types = ['sine', 'sawtooth', 'triangle', 'pulse']
+        self.current_type = 0
+
+    def set_frequency(self, freq):
+        self.freq = freq
+
+    def set_type(self, type_idx):
+        self.current_type = type_idx % len(self.types)
+
+    def get_samples(self, num_samples):
+        phase_increment = 2.0 * np.pi * self.freq / self.sample_rate
+        phases = np.linspace(self.phase,
+                           self.phase + phase_increment * num_samples,
+                           num_samples, endpoint=False)
+
+        if self.types[self.current_type] == 'sine':
+            samples = np.sin(phases)
+        elif self.types[self.current_type] == 'sawtooth':
+            samples = 2.0 * (phases / (2.0 * np.pi) - np.floor(0.5 + phases / (2.0 * np.pi)))
+        elif self.types[self.current_type] == 'triangle':
+            samples = 2.0 * np.abs(2.0 * (phases / (2.0 * np.pi) - np.floor(0.5 + phases / (2.0 * np.pi)))) - 1.0
+        else:  # pulse
+            samples = np.where(np.sin(phases) >= 0, 1.0, -1.0)
+
+        self.phase = phases[-1] + phase_increment
+        self.phase %= 2.0 * np.pi
+
+        return samples
+
+class ReferenceEnvelope:
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.attack = 0.1  # seconds
+        self.decay = 0.1   # seconds
+        self.sustain = 0.7 # level (0-1)
+        self.release = 0.2 # seconds
+
+        self.current_level = 0.0
+        self.state = 'idle'
+        self.samples_processed = 0
+
+    def set_attack(self, attack_time):
+        self.attack = max(0.001, attack_time)
+
+    def set_decay(self, decay_time):
+        self.decay = max(0.001, decay_time)
+
+    def set_sustain(self, sustain_level):
+        self.sustain = np.clip(sustain_level, 0.0, 1.0)
+
+    def set_release(self, release_time):
+        self.release = max(0.001, release_time)
+
+    def note_on(self):
+        self.state = 'attack'
+        self.samples_processed = 0
+
+    def note_off(self):
+        self.state = 'release'
+        self.samples_processed = 0
+
+    def get_envelope(self, num_samples):
+        envelope = np.zeros(num_samples)
+        current_sample = 0
+
+        while current_sample < num_samples:
+            if self.state == 'idle':
+                envelope[current_sample:] = 0.0
+                break
+
+            elif self.state == 'attack':
+                attack_samples = int(self.attack * self.sample_rate)
+                remaining = max(0, attack_samples - self.samples_processed)
+                samples_to_process = min(remaining, num_samples - current_sample)
+
+                t = np.linspace(self.current_level,
+                              1.0,
+                              samples_to_process + 1)[:-1]
+                envelope[current_sample:current_sample + samples_to_process] = t
+
+                self.samples_processed += samples_to_process
+                current_sample += samples_to_process
+                self.current_level = t[-1] if len(t) > 0 else self.current_level
+
+                if self.samples_processed >= attack_samples:
+                    self.state = 'decay'
+                    self.samples_processed = 0
+
+            elif self.state == 'decay':
+                decay_samples = int(self.decay * self.sample_rate)
+                remaining = max(0, decay_samples - self.samples_processed)
+                samples_to_process = min(remaining, num_samples - current_sample)
+
+                t = np.linspace(self.current_level,
+                              self.sustain,
+                              samples_to_process + 1)[:-1]
+                envelope[current_sample:current_sample + samples_to_process] = t
+
+                self.samples_processed += samples_to_process
+                current_sample += samples_to_process
+                self.current_level = t[-1] if len(t) > 0 else self.current_level
+
+                if self.samples_processed >= decay_samples:
+                    self.state = 'sustain'
+
+            elif self.state == 'sustain':
+                envelope[current_sample:] = self.sustain
+                current_sample = num_samples
+                self.current_level = self.sustain
+
+            elif self.state == 'release':
+                release_samples = int(self.release * self.sample_rate)
+                remaining = max(0, release_samples - self.samples_processed)
+                samples_to_process = min(remaining, num_samples - current_sample)
+
+                t = np.linspace(self.current_level,
+                              0.0,
+                              samples_to_process + 1)[:-1]
+                envelope[current_sample:current_sample + samples_to_process] = t
+
+                self.samples_processed += samples_to_process
+                current_sample += samples_to_process
+                self.current_level = t[-1] if len(t) > 0 else self.current_level
+
+                if self.samples_processed >= release_samples:
+                    self.state = 'idle'
+
+        return envelope
+
+class ReferenceVoice:
+    def __init__(self, sample_rate):
+        self.oscillator = ReferenceOscillator(sample_rate)
+        self.envelope = ReferenceEnvelope(sample_rate)
+        self.note = None
+        self.velocity = 0
+        self.active = False
+
+    def note_on(self, note, velocity):
+        self.note = note
+        self.velocity = velocity / 127.0
+        self.oscillator.set_frequency(440.0 * (2.0 ** ((note - 69) / 12.0)))
+        self.envelope.note_on()
+        self.active = True
+
+    def note_off(self):
+        self.envelope.note_off()
+
+    def is_active(self):
+        return self.active and self.envelope.state != 'idle'
+
+    def generate_samples(self, num_samples):
+        if not self.active:
+            return np.zeros(num_samples)
+
+        samples = self.oscillator.get_samples(num_samples)
+        envelope = self.envelope.get_envelope(num_samples)
+
+        if not self.is_active():
+            self.active = False
+
+        return samples * envelope * self.velocity
+
+class ReferenceVoiceManager:
+    def __init__(self, sample_rate, max_voices=16):
+        self.voices = [ReferenceVoice(sample_rate) for _ in range(max_voices)]
+        self.sample_rate = sample_rate
+
+    def note_on(self, note, velocity):
+        voice = next((v for v in self.voices if not v.is_active()), None)
+        if voice is None:
+            voice = self.voices[0]
+            self.voices = self.voices[1:] + [self.voices[0]]
+        voice.note_on(note, velocity)
+
+    def note_off(self, note):
+        for voice in self.voices:
+            if voice.note == note:
+                voice.note_off()
+
+    def get_audio_block(self, num_samples):
+        mixed = np.zeros(num_samples)
+        active_voices = 0
+        for voice in self.voices:
+            if voice.is_active():
+                mixed += voice.generate_samples(num_samples)
+                active_voices += 1
+        if active_voices > 0:
+            mixed /= max(1, np.sqrt(active_voices))
+        return mixed
+
+    def handle_control_change(self, control, value):
+        normalized_value = value / 127.0
+        for voice in self.voices:
+            if control == 73:
+                voice.envelope.set_attack(normalized_value * 2.0)
+            elif control == 74:
+                voice.envelope.set_decay(normalized_value * 2.0)
+            elif control == 75:
+                voice.envelope.set_sustain(normalized_value)
+            elif control == 76:
+                voice.envelope.set_release(normalized_value * 2.0)
+            elif control == 77:
+                voice.oscillator.set_type(int(normalized_value * 3))
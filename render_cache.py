@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+class RenderCache:
+    """LRU cache of fully rendered one-shot notes, bounded by total array bytes.
+
+    Pinned renders (memory-mapped patch bundle arrays) sit in a separate
+    lookup that is checked first, never evicted and not counted against
+    max_bytes, since they aren't resident until played.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.pinned = {}
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, render):
+        """Return the cached render for key, calling render() on a miss"""
+        samples = self.pinned.get(key)
+        if samples is not None:
+            self.hits += 1
+            return samples
+
+        samples = self.entries.get(key)
+        if samples is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return samples
+
+        self.misses += 1
+        samples = render()
+        self.put(key, samples)
+        return samples
+
+    def put(self, key, samples):
+        """Insert a render into the LRU"""
+        if samples.nbytes > self.max_bytes:
+            return  # Too big to ever fit; play it uncached
+        if key in self.entries:
+            self.bytes_used -= self.entries.pop(key).nbytes
+
+        while self.entries and self.bytes_used + samples.nbytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes_used -= evicted.nbytes
+            self.evictions += 1
+
+        self.entries[key] = samples
+        self.bytes_used += samples.nbytes
+
+    def pin(self, key, samples):
+        """Add a render that lives outside the LRU (e.g. a memory-mapped patch bundle row)"""
+        self.pinned[key] = samples
+
+    def clear(self):
+        self.entries.clear()
+        self.pinned.clear()
+        self.bytes_used = 0
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'pinned': len(self.pinned),
+            'bytes_used': self.bytes_used,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
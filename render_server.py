@@ -0,0 +1,324 @@
+"""Local multi-session render server.
+
+Each client connection owns one RenderSession (its own VoiceManager, patch
+and event stream). Clients talk in frames of a 1-byte type, a 4-byte
+little-endian payload length and the payload:
+
+    client -> server
+      b'H'  JSON session config: sample_rate, block_size, max_voices, patch
+            (blocks already requested are still rendered, with the new config)
+      b'M'  raw MIDI bytes (running status allowed)
+      b'R'  uint32 number of blocks to render (at most MAX_PENDING_BLOCKS outstanding)
+      b'S'  empty; asks for session stats
+    server -> client
+      b'P'  one rendered block of float32 mono PCM
+      b'J'  JSON (stats reply, or errors)
+
+Rendering is done by one scheduler for all sessions: every round renders one
+block for each session with outstanding requests, then waits once for all of
+their sockets to drain. The oscillators of every session in a round are
+rendered together (one array call per waveform and block size); envelopes,
+voice allocation and mixing still run session by session, since each session
+has its own voice pool and patch. A malformed frame or
+config gets a b'J' error reply and the session stays open; a session that
+fails while rendering gets a b'J' error and is closed.
+"""
+import asyncio
+import json
+import struct
+import time
+from collections import deque
+import numpy as np
+from voice_manager import VoiceManager
+from oscillator import OscillatorBank
+from midi_sources import MIDIByteParser
+
+FRAME_HEADER = struct.Struct('<cI')
+BLOCK_COUNT = struct.Struct('<I')
+CONFIG_LIMITS = {'sample_rate': 768000, 'block_size': 16384, 'max_voices': 256}
+MAX_PENDING_BLOCKS = 1 << 16  # Outstanding blocks per session
+
+class RenderSession:
+    def __init__(self, session_id, writer, sample_rate=44100, block_size=256, max_voices=16, patch=None):
+        self.session_id = session_id
+        self.writer = writer
+        # [perf_counter time, blocks left] per R frame; kept across reconfigures
+        self.requests = deque()
+        self.pending = 0
+        self.configure(sample_rate, block_size, max_voices, patch)
+
+    def configure(self, sample_rate=44100, block_size=256, max_voices=16, patch=None):
+        settings = {'sample_rate': sample_rate, 'block_size': block_size, 'max_voices': max_voices}
+        for name, value in settings.items():
+            if type(value) is not int or not 0 < value <= CONFIG_LIMITS[name]:
+                raise ValueError(f"{name} must be an integer from 1 to {CONFIG_LIMITS[name]}, got {value!r}")
+        if patch is not None and not isinstance(patch, dict):
+            raise ValueError(f"patch must be an object, got {patch!r}")
+
+        # Build first, so a rejected config leaves the session as it was
+        voice_manager = VoiceManager(sample_rate, max_voices, verbose=False)
+        voice_manager.apply_patch(patch or {})
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.voice_manager = voice_manager
+        self.parser = MIDIByteParser()
+
+        self.blocks_rendered = 0
+        self.render_time_total = 0.0
+        self.render_time_max = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.events = 0
+
+    def handle_midi(self, data):
+        for message in self.parser.feed(data):
+            self.events += 1
+            self.voice_manager.handle_midi_message(message)
+
+    def request(self, blocks):
+        if self.pending + blocks > MAX_PENDING_BLOCKS:
+            raise ValueError(f"{blocks} more blocks would exceed {MAX_PENDING_BLOCKS} pending "
+                             f"({self.pending} already pending)")
+        if blocks:
+            self.requests.append([time.perf_counter(), blocks])
+            self.pending += blocks
+
+    def render_block(self):
+        start = time.perf_counter()
+        block = self.voice_manager.get_audio_block(self.block_size).astype(np.float32)
+        done = time.perf_counter()
+        payload = block.tobytes()
+        self.writer.write(FRAME_HEADER.pack(b'P', len(payload)) + payload)
+
+        request = self.requests[0]
+        request[1] -= 1
+        if not request[1]:
+            self.requests.popleft()
+        self.pending -= 1
+
+        elapsed = done - start
+        latency = done - request[0]
+        self.blocks_rendered += 1
+        self.render_time_total += elapsed
+        self.render_time_max = max(self.render_time_max, elapsed)
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def get_stats(self):
+        blocks = max(1, self.blocks_rendered)
+        audio_time = self.blocks_rendered * self.block_size / self.sample_rate
+        return {
+            'session': self.session_id,
+            'blocks': self.blocks_rendered,
+            'pending': self.pending,
+            'events': self.events,
+            'audio_seconds': audio_time,
+            'realtime_factor': audio_time / self.render_time_total if self.render_time_total else 0.0,
+            'mean_render_ms': self.render_time_total / blocks * 1000,
+            'max_render_ms': self.render_time_max * 1000,
+            'mean_latency_ms': self.latency_total / blocks * 1000,
+            'max_latency_ms': self.latency_max * 1000,
+        }
+
+class RenderServer:
+    def __init__(self, host='127.0.0.1', port=0, path=None, max_sessions=64, defaults=None):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_sessions = max_sessions
+        self.defaults = defaults or {}
+        self.sessions = {}
+        self.server = None
+        self.rounds = 0
+        self._next_id = 1
+        self._work = asyncio.Event()
+        self._scheduler = None
+        self.oscillator_bank = OscillatorBank()
+
+    async def start(self):
+        if self.path:
+            self.server = await asyncio.start_unix_server(self._handle_client, self.path)
+            print(f"Render server listening on {self.path}")
+        else:
+            self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+            print(f"Render server listening on {self.host}:{self.port}")
+        self._scheduler = asyncio.create_task(self._schedule())
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self._scheduler:
+            self._scheduler.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle_client(self, reader, writer):
+        if len(self.sessions) >= self.max_sessions:
+            self._send_json(writer, {'error': 'server full'})
+            writer.close()
+            return
+
+        session = RenderSession(self._next_id, writer, **self.defaults)
+        self._next_id += 1
+        self.sessions[session.session_id] = session
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                kind, length = FRAME_HEADER.unpack(header)
+                payload = await reader.readexactly(length) if length else b''
+
+                try:
+                    self._dispatch(session, kind, payload)
+                except (ValueError, TypeError, KeyError, struct.error) as e:
+                    # Malformed frame or config: report it and keep the session up
+                    self._send_json(writer, {'error': f'bad {kind.decode(errors="replace")!r} frame: {e}'})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.pop(session.session_id, None)
+            writer.close()
+
+    def _dispatch(self, session, kind, payload):
+        if kind == b'M':
+            session.handle_midi(payload)
+        elif kind == b'R':
+            session.request(BLOCK_COUNT.unpack(payload)[0])
+            self._work.set()
+        elif kind == b'H':
+            config = {**self.defaults, **json.loads(payload)}
+            session.configure(**config)
+        elif kind == b'S':
+            self._send_json(session.writer, session.get_stats())
+        else:
+            self._send_json(session.writer, {'error': f'unknown frame type {kind!r}'})
+
+    def _send_json(self, writer, data):
+        payload = json.dumps(data).encode()
+        writer.write(FRAME_HEADER.pack(b'J', len(payload)) + payload)
+
+    async def _schedule(self):
+        """Render one block per ready session each round, then drain all their sockets at once.
+
+        The round's plain oscillators, across all sessions, are rendered first
+        in one batch; each session's own render then picks up its rows (see
+        OscillatorBank). The rest of each session's render runs on its own.
+        """
+        while True:
+            ready = [s for s in self.sessions.values() if s.requests]
+            if not ready:
+                self._work.clear()
+                await self._work.wait()
+                continue
+
+            # One block for every ready session per round, with no awaits in between
+            try:
+                self._render_oscillators(ready)
+            except Exception as e:
+                print(f"Batched oscillator render failed, sessions render their own: {e!r}")
+            rendered = []
+            for session in ready:
+                try:
+                    session.render_block()
+                    rendered.append(session)
+                except Exception as e:
+                    # A session whose patch can't render is closed; the others carry on
+                    self._drop(session, f'render failed: {e!r}')
+            self.rounds += 1
+            await asyncio.gather(*(s.writer.drain() for s in rendered), return_exceptions=True)
+
+    def _render_oscillators(self, sessions):
+        by_block_size = {}
+        for session in sessions:
+            by_block_size.setdefault(session.block_size, []).extend(session.voice_manager.live_oscillators())
+        for block_size, oscillators in by_block_size.items():
+            self.oscillator_bank.render(oscillators, block_size)
+
+    def _drop(self, session, error):
+        print(f"Render session {session.session_id} dropped: {error}")
+        self.sessions.pop(session.session_id, None)
+        self._send_json(session.writer, {'error': error})
+        session.writer.close()
+
+    def get_stats(self):
+        return {
+            'sessions': len(self.sessions),
+            'rounds': self.rounds,
+            'per_session': [s.get_stats() for s in self.sessions.values()],
+        }
+
+class RenderClient:
+    """Minimal asyncio client for RenderServer"""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=None, path=None):
+        if path:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def _send(self, kind, payload=b''):
+        self.writer.write(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+    async def _read_frame(self):
+        kind, length = FRAME_HEADER.unpack(await self.reader.readexactly(FRAME_HEADER.size))
+        return kind, await self.reader.readexactly(length)
+
+    async def configure(self, **config):
+        self._send(b'H', json.dumps(config).encode())
+        await self.writer.drain()
+
+    async def send_midi(self, data):
+        self._send(b'M', bytes(data))
+        await self.writer.drain()
+
+    async def render(self, blocks):
+        """Request blocks and return them concatenated as one float32 array"""
+        self._send(b'R', BLOCK_COUNT.pack(blocks))
+        await self.writer.drain()
+        chunks = []
+        while len(chunks) < blocks:
+            kind, payload = await self._read_frame()
+            if kind == b'P':
+                chunks.append(np.frombuffer(payload, dtype=np.float32))
+            elif kind == b'J':
+                raise RuntimeError(json.loads(payload).get('error', 'unexpected reply'))
+        return np.concatenate(chunks)
+
+    async def stats(self):
+        self._send(b'S')
+        await self.writer.drain()
+        while True:
+            kind, payload = await self._read_frame()
+            if kind == b'J':
+                return json.loads(payload)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Multi-session synth render server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7400)
+    parser.add_argument('--unix', help="Unix socket path instead of TCP")
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--block-size', type=int, default=256)
+    args = parser.parse_args()
+
+    server = RenderServer(args.host, args.port, args.unix,
+                          defaults={'sample_rate': args.sample_rate, 'block_size': args.block_size})
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("\nRender server stopped")
@@ -0,0 +1,84 @@
+from math import gcd
+import numpy as np
+
+# (up, down, taps, rolloff, beta) -> bank, designed once when the first resampler for a
+# ratio is built (never in the audio callback); also seeded from compiled patch bundles
+FILTER_BANKS = {}
+
+def design_filter_bank(up, down, taps_per_phase=16, rolloff=0.9, beta=8.0):
+    """Kaiser-windowed sinc lowpass split into an (up, taps_per_phase) polyphase bank.
+
+    bank[p, k] is the tap applied to x[base - k] for output phase p.
+    """
+    key = (up, down, taps_per_phase, rolloff, beta)
+    if key in FILTER_BANKS:
+        return FILTER_BANKS[key]
+    length = up * taps_per_phase
+    cutoff = rolloff * 0.5 / max(up, down)  # cycles per sample at the upsampled rate
+    n = np.arange(length) - (length - 1) / 2.0
+    h = 2.0 * cutoff * np.sinc(2.0 * cutoff * n) * np.kaiser(length, beta) * up
+    bank = h.reshape(taps_per_phase, up).T.copy()
+    bank.setflags(write=False)
+    FILTER_BANKS[key] = bank
+    return bank
+
+class PolyphaseResampler:
+    """Streaming rational-ratio resampler between the engine rate and the device rate.
+
+    Pull-based: pull(frames, render) asks render(n) for exactly as many engine
+    samples as the requested output frames need, so it can sit directly in an
+    audio callback. Works on (n,) or (n, channels) blocks.
+    """
+    def __init__(self, in_rate, out_rate, taps_per_phase=16):
+        g = gcd(int(in_rate), int(out_rate))
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.up = int(out_rate) // g
+        self.down = int(in_rate) // g
+        self.taps = taps_per_phase
+        self.bank = design_filter_bank(self.up, self.down, taps_per_phase)
+        self._tap_offsets = (self.taps - 1) - np.arange(self.taps)
+        self.reset()
+
+    def reset(self):
+        # buffer[taps - 1 + i] holds the i-th input sample not yet fully consumed
+        self.buffer = None
+        self.numer = 0  # next output position in units of 1/up input samples
+
+    @property
+    def latency(self):
+        """Filter group delay in output samples"""
+        return (self.taps * self.up - 1) / 2.0 / self.down
+
+    def required_input(self, frames):
+        last_base = (self.numer + self.down * (frames - 1)) // self.up
+        have = 0 if self.buffer is None else len(self.buffer) - (self.taps - 1)
+        return max(0, last_base + 1 - have)
+
+    def pull(self, frames, render):
+        needed = self.required_input(frames)
+        block = render(needed) if needed else None
+        return self.process(block, frames)
+
+    def process(self, block, frames):
+        """Append block (may be None) and produce exactly frames output samples"""
+        if self.buffer is None:
+            shape = (self.taps - 1,) if block is None or np.ndim(block) == 1 else (self.taps - 1, block.shape[1])
+            self.buffer = np.zeros(shape)
+        if block is not None and len(block):
+            self.buffer = np.concatenate([self.buffer, block])
+
+        numers = self.numer + self.down * np.arange(frames)
+        bases = numers // self.up
+        phases = numers % self.up
+        if bases[-1] + self.taps > len(self.buffer):
+            raise ValueError("not enough input for requested output frames; use required_input()")
+
+        window = self.buffer[bases[:, None] + self._tap_offsets]
+        output = np.einsum('ij...,ij->i...', window, self.bank[phases])
+
+        self.numer += self.down * frames
+        shift = self.numer // self.up
+        self.buffer = self.buffer[shift:]
+        self.numer -= shift * self.up
+        return output
@@ -0,0 +1,210 @@
+import struct
+import numpy as np
+from voice_manager import Voice
+from oscillator import midi_to_freq
+from profiler import profiler
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+INT24 = 'int24'  # Packed little-endian 24-bit PCM; numpy has no dtype for it
+
+def _sample_format(dtype):
+    """(memmap dtype, bytes per sample, scale, bias): stored values * scale - bias span [-1, 1)"""
+    if isinstance(dtype, str) and dtype == INT24:
+        return np.uint8, 3, 1.0 / 8388608.0, 0.0
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'i':
+        return dtype, dtype.itemsize, 1.0 / float(np.iinfo(dtype).max + 1), 0.0
+    if dtype.kind == 'u':
+        # Unsigned PCM is offset binary: silence sits at half range
+        return dtype, dtype.itemsize, 1.0 / float(np.iinfo(dtype).max // 2 + 1), 1.0
+    if dtype.kind == 'f':
+        return dtype, dtype.itemsize, 1.0, 0.0
+    raise ValueError(f"unsupported sample dtype {dtype}")
+
+def _unpack_int24(window):
+    """(frames, channels, 3) packed bytes -> (frames, channels) int32"""
+    unpacked = np.zeros(window.shape[:-1] + (4,), dtype=np.uint8)
+    unpacked[..., 1:] = window
+    return unpacked.view('<i4')[..., 0] >> 8
+
+def _wav_layout(path):
+    """Parse a WAV header and return (data_offset, frames, channels, dtype, sample_rate)"""
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f"{path}: not a RIFF/WAVE file")
+
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path}: no data chunk found")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+
+            if chunk_id == b'fmt ':
+                raw = f.read(chunk_size)
+                format_tag, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', raw[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(raw) >= 26:
+                    format_tag = struct.unpack('<H', raw[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, bits)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{path}: data chunk before fmt chunk")
+                format_tag, channels, sample_rate, bits = fmt
+                if format_tag == WAVE_FORMAT_PCM and bits in (8, 16, 24, 32):
+                    # 8-bit WAV is unsigned, wider PCM is signed
+                    dtype = {8: np.uint8, 16: np.int16, 24: INT24, 32: np.int32}[bits]
+                elif format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+                    dtype = np.float32 if bits == 32 else np.float64
+                else:
+                    raise ValueError(f"{path}: unsupported WAV format {format_tag} ({bits}-bit); "
+                                     "use 8/16/24/32-bit PCM or 32/64-bit float")
+                frames = chunk_size // (channels * _sample_format(dtype)[1])
+                return f.tell(), frames, channels, dtype, sample_rate
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1)
+
+class SampleZone:
+    """One memory-mapped sample and the key/velocity range it covers.
+
+    Nothing is read at load time: the OS pages sample data in as voices touch it.
+    Raw files take any numpy int, uint or float dtype, or INT24 for packed
+    24-bit PCM; unsigned formats are offset binary and are centered on read.
+    """
+    def __init__(self, path, root_note, lo_note=0, hi_note=127, lo_vel=1, hi_vel=127,
+                 dtype=None, channels=1, sample_rate=None):
+        self.path = path
+        self.root_note = root_note
+        self.lo_note, self.hi_note = lo_note, hi_note
+        self.lo_vel, self.hi_vel = lo_vel, hi_vel
+
+        if str(path).lower().endswith('.wav'):
+            offset, frames, channels, dtype, wav_rate = _wav_layout(path)
+            self.sample_rate = sample_rate or wav_rate
+        else:
+            # Raw files: headerless interleaved samples, format supplied by the caller
+            if dtype is None or sample_rate is None:
+                raise ValueError(f"{path}: raw samples need dtype and sample_rate")
+            offset = 0
+            self.sample_rate = sample_rate
+            frames = None
+
+        try:
+            storage, width, self.scale, self.bias = _sample_format(dtype)
+        except (TypeError, ValueError):
+            raise ValueError(f"{path}: unsupported sample dtype {dtype!r}") from None
+        self.packed = isinstance(dtype, str) and dtype == INT24
+        self.channels = channels
+        frame_shape = (channels, 3) if self.packed else (channels,)
+        shape = (frames,) + frame_shape if frames is not None else None
+        data = np.memmap(path, dtype=storage, mode='r', offset=offset, shape=shape)
+        if frames is None:
+            frame_size = channels * width
+            data = data[:len(data) - len(data) % frame_size].reshape((-1,) + frame_shape)
+        self.data = data
+        self.length = len(data)
+
+    def read(self, start, stop):
+        """Float mono frames [start, stop) - only this window is paged in"""
+        window = self.data[start:stop]
+        if self.packed:
+            window = _unpack_int24(window)
+        samples = (window.mean(axis=1) if self.channels > 1 else window[:, 0]) * self.scale
+        if self.bias:
+            samples -= self.bias  # Unsigned formats: move silence from half range to 0
+        return samples
+
+class SamplerInstrument:
+    """Multi-sample instrument with precomputed note x velocity lookup tables"""
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.zones = []
+        self.zone_map = np.full((128, 128), -1, dtype=np.int16)
+        self.pitch_ratio = np.zeros((128, 128))
+
+    def add_zone(self, path, root_note, lo_note=0, hi_note=127, lo_vel=1, hi_vel=127, **kwargs):
+        self.zones.append(SampleZone(path, root_note, lo_note, hi_note, lo_vel, hi_vel, **kwargs))
+        self.build_keymap()
+        return self.zones[-1]
+
+    def build_keymap(self):
+        # Later zones win where ranges overlap
+        self.zone_map.fill(-1)
+        self.pitch_ratio.fill(0.0)
+        notes = np.arange(128)
+        for idx, zone in enumerate(self.zones):
+            self.zone_map[zone.lo_note:zone.hi_note + 1, zone.lo_vel:zone.hi_vel + 1] = idx
+            ratio = 2.0 ** ((notes - zone.root_note) / 12.0) * zone.sample_rate / self.sample_rate
+            mask = self.zone_map == idx
+            self.pitch_ratio[mask] = np.broadcast_to(ratio[:, None], (128, 128))[mask]
+
+    def lookup(self, note, velocity):
+        idx = self.zone_map[note, velocity]
+        if idx < 0:
+            return None, 0.0
+        return self.zones[idx], self.pitch_ratio[note, velocity]
+
+class SamplerVoice(Voice):
+    """Voice that plays back a zone of a SamplerInstrument through the normal ADSR path"""
+    def __init__(self, sample_rate, instrument):
+        super().__init__(sample_rate)
+        self.instrument = instrument
+        self.zone = None
+        self.ratio = 0.0
+        self.position = 0.0
+        self._ramp = np.arange(0)
+
+    def note_on(self, note, velocity):
+        self.zone, self.ratio = self.instrument.lookup(note, velocity)
+        self.position = 0.0
+        self.note = note
+        self.velocity = velocity / 127.0
+        self.oscillator.set_frequency(midi_to_freq(note))
+        self.envelope.note_on()
+        self.active = self.zone is not None
+
+    def live_oscillator(self):
+        return None  # Plays sample data; the oscillator only tracks the note's frequency
+
+    def is_active(self):
+        return super().is_active() and self.zone is not None and self.position < self.zone.length - 1
+
+    def read_samples(self, num_samples):
+        if len(self._ramp) != num_samples:
+            self._ramp = np.arange(num_samples)
+
+        # Linear interpolation over the window of source frames this block touches
+        positions = self.position + self.ratio * self._ramp
+        start = int(positions[0])
+        stop = min(int(positions[-1]) + 2, self.zone.length)
+        window = self.zone.read(start, stop)
+
+        local = positions - start
+        index = np.minimum(local.astype(np.int64), len(window) - 1)
+        nxt = np.minimum(index + 1, len(window) - 1)
+        frac = local - index
+        samples = window[index] + (window[nxt] - window[index]) * frac
+        samples[positions >= self.zone.length - 1] = 0.0
+
+        self.position += self.ratio * num_samples
+        return samples
+
+    def generate_samples(self, num_samples):
+        if not self.active or self.zone is None:
+            return np.zeros(num_samples)
+
+        samples = self.read_samples(num_samples)
+        envelope = self.envelope.get_envelope(num_samples)
+
+        if not self.is_active():
+            self.active = False
+
+        return samples * envelope * self.velocity
+
+profiler.register(SamplerVoice, 'read_samples', 'oscillator', waveform=lambda voice: 'sampler')
+
+def load_instrument(voice_manager, instrument):
+    """Switch every voice in voice_manager to sample playback from instrument"""
+    voice_manager.set_voice_factory(lambda sample_rate: SamplerVoice(sample_rate, instrument))
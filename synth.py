@@ -3,18 +3,58 @@ import sounddevice as sd
 from datetime import datetime as import_time
 from midi_handler import MIDIHandler
 from voice_manager import VoiceManager
-import sounddevice as sd
+from audio_output import AudioOutput
 from oscillator import midi_to_freq
+from resampler import PolyphaseResampler
+from profiler import profiler
+from metering import MeterTap, LevelMeter
+from midi_replay import MIDICapture
+from autotune import calibrate_block_size
+
+def query_output_device(fallback_rate=44100, max_channels=2):
+    """(sample rate, channel count) of the default output device; stereo when it has two or more outputs"""
+    try:
+        default_device = sd.default.device[1]
+        if default_device is not None and default_device >= 0:
+            info = sd.query_devices()[default_device]
+            channels = max(1, min(max_channels, int(info['max_output_channels'])))
+            return int(info['default_samplerate']), channels
+    except Exception:
+        pass
+    return fallback_rate, 1
 
 class Synthesizer:
-    def __init__(self):
-        self.sample_rate = 44100
-        self.block_size = 256
-        self.voice_manager = VoiceManager(self.sample_rate)
-        self.audio_output = AudioOutput(self.sample_rate, self.block_size)
+    def __init__(self, null_mode='realtime', null_speed=1.0, engine_rate=None,
+                 block_size=256, autotune=False, safety_margin=0.5, adaptive_polyphony=False,
+                 channels=None, sends=0, null_duration=None):
+        # The device runs at its native rate; the engine can run at its own
+        # (lower for cheap patches, oversampled for quality) and is converted once
+        self.device_rate, device_channels = query_output_device()
+        self.channels = channels or device_channels
+        self.sample_rate = engine_rate or self.device_rate
+        self.block_size = block_size
+        if autotune:
+            self.block_size = calibrate_block_size(self.device_rate, self.sample_rate,
+                                                   safety_margin=safety_margin)
+        self.sends = sends
+        self.voice_manager = VoiceManager(self.sample_rate, channels=self.channels, sends=sends)
+        self.meter_tap = None
+        self.meter = None
+        self.capture = None
+        self.profiling = False
+        if adaptive_polyphony:
+            self.voice_manager.enable_governor()
+        self.resampler = None
+        if self.sample_rate != self.device_rate:
+            self.resampler = PolyphaseResampler(self.sample_rate, self.device_rate)
+        self.audio_output = AudioOutput(self.device_rate, self.block_size,
+                                        null_mode=null_mode, null_speed=null_speed, null_duration=null_duration)
         self.midi_handler = MIDIHandler(self.handle_midi_message)
         
     def handle_midi_message(self, message, _):
+        capture = self.capture  # stop_capture() may clear it from another thread
+        if capture:
+            capture.record(message)
         status = message[0]
         msg_type = status & 0xF0
         channel = (status & 0x0F) + 1
@@ -37,11 +77,9 @@ class Synthesizer:
                 print(f"Note: {note_name}{octave} (MIDI: {note})")
                 print(f"Frequency: {freq:.1f} Hz")
                 print(f"Velocity: {velocity} ({velocity/127.0*100:.0f}%)")
-                self.voice_manager.note_on(note, velocity)
             else:
                 print(f"Type: Note Off (zero velocity)")
                 print(f"Note: {note}")
-                self.voice_manager.note_off(note)
         elif msg_type == 0x80:  # Note Off
             note = message[1]
             velocity = message[2]
@@ -50,7 +88,6 @@ class Synthesizer:
             print(f"Type: Note Off")
             print(f"Note: {note_name}{octave} (MIDI: {note})")
             print(f"Release Velocity: {velocity}")
-            self.voice_manager.note_off(note)
         elif msg_type == 0xB0:  # Control Change
             control = message[1]
             value = message[2]
@@ -62,7 +99,8 @@ class Synthesizer:
                 74: ("Decay Time", "ms", normalized * 2000),
                 75: ("Sustain Level", "%", normalized * 100),
                 76: ("Release Time", "ms", normalized * 2000),
-                77: ("Oscillator Type", "", int(normalized * 3))
+                77: ("Oscillator Type", "", int(normalized * 3)),
+                1: ("FM Modulation Depth", "%", normalized * 200)
             }
             
             print(f"Type: Control Change")
@@ -75,28 +113,124 @@ class Synthesizer:
             else:
                 print(f"Parameter: Unmapped Control {control}")
                 print(f"Value: {value} ({normalized*100:.0f}%)")
-                
-            self.handle_control_change(control, value)
+
+        self.voice_manager.handle_midi_message(message)
 
     def handle_control_change(self, control, value):
-        normalized_value = value / 127.0
-        if control == 73:  # Attack
-            self.voice_manager.set_attack(normalized_value * 2.0)
-        elif control == 74:  # Decay
-            self.voice_manager.set_decay(normalized_value * 2.0)
-        elif control == 75:  # Sustain
-            self.voice_manager.set_sustain(normalized_value)
-        elif control == 76:  # Release
-            self.voice_manager.set_release(normalized_value * 2.0)
-        elif control == 77:  # Oscillator Type
-            self.voice_manager.set_oscillator_type(int(normalized_value * 3))
+        self.voice_manager.handle_control_change(control, value)
 
     def audio_callback(self, outdata, frames, time, status):
+        # The stream holds this bound method, so profiling is switched by a flag here
+        if self.profiling:
+            profiler.call('output', self._fill_output, outdata, frames, status, audit=True)
+        else:
+            self._fill_output(outdata, frames, status)
+
+    def _fill_output(self, outdata, frames, status):
         if status:
             print(status)
         
-        audio_block = self.voice_manager.get_audio_block(frames)
-        outdata[:] = audio_block.reshape(-1, 1)
+        audio_block = self.render_block(frames)
+        outdata[:] = audio_block.reshape(-1, self.channels)
+
+    def render_block(self, frames):
+        """frames samples at the device rate, resampled from the engine if needed.
+
+        Mono output is (frames,); otherwise (frames, channels) with the main
+        channels of the bus mix (send buses are left to effect processing).
+        """
+        if self.profiling:
+            return profiler.call('render', self._render_block, frames, audit=True)
+        return self._render_block(frames)
+
+    def _render_block(self, frames):
+        # The rendered layout never depends on metering, so the resampler's
+        # history always matches it; sends are only dropped after the meter tap
+        if self.channels > 1 or self.sends:
+            render = self.voice_manager.get_bus_block
+        else:
+            render = self.voice_manager.get_audio_block
+        block = self.resampler.pull(frames, render) if self.resampler else render(frames)
+        meter_tap = self.meter_tap
+        if meter_tap:
+            meter_tap.push(block)
+        if self.sends:
+            block = block[:, :self.channels] if self.channels > 1 else block[:, 0]
+        return block
+
+    def start_capture(self, path):
+        """Log every incoming MIDI message to path for replay with midi_replay.py"""
+        self.stop_capture()
+        self.capture = MIDICapture(path)
+        return self.capture
+
+    def stop_capture(self):
+        if self.capture:
+            capture, self.capture = self.capture, None
+            capture.close()
+
+    def enable_metering(self, **options):
+        """Meter the output on a background thread; options go to LevelMeter"""
+        if self.meter:
+            return self.meter
+        names = {1: ['mono'], 2: ['left', 'right']}.get(self.channels,
+                                                         [f"ch{i}" for i in range(self.channels)])
+        names += [f"send{i}" for i in range(self.sends)]
+        parts = {'main': list(range(self.channels))}
+        parts.update({f"send{i}": [self.channels + i] for i in range(self.sends)})
+        self.meter = LevelMeter(MeterTap(len(names)), self.device_rate, names, parts, **options)
+        self.meter.start()
+        self.meter_tap = self.meter.tap  # Set last: the callback starts pushing from here on
+        return self.meter
+
+    def disable_metering(self):
+        if self.meter:
+            self.meter_tap = None
+            self.meter.stop()
+            self.meter = None
+
+    def get_levels(self):
+        return self.meter.get_levels() if self.meter else {}
+
+    def enable_profiling(self, audit_allocations=False):
+        """Time oscillator/envelope/mix/resample/output stages from the next block on"""
+        profiler.reset()
+        profiler.enable(audit_allocations)
+        self.profiling = True
+
+    def disable_profiling(self):
+        self.profiling = False
+        profiler.disable()
+
+    def get_profile(self):
+        return profiler.to_json()
+
+    def run_headless(self):
+        """Drive the engine from the null backend's clock until it stops or Ctrl+C"""
+        backend = self.audio_output.backend
+        self.audio_output.attach_renderer(self.render_block)
+        print(f"\nRendering through null audio backend ({backend.mode} mode)")
+        print("MIDI events will be processed and voices rendered without a device")
+        if backend.max_samples is not None:
+            print(f"Stopping after {backend.max_samples / backend.sample_rate:.1f} seconds of audio")
+        try:
+            while backend.is_running:
+                backend.wait(0.1)
+        except KeyboardInterrupt:
+            print("\nShutting down synthesizer...")
+        finally:
+            backend.stop()
+            if self.meter:
+                self.meter.stop()
+                print("\nOutput Levels:")
+                print("-------------")
+                for name, level in self.meter.get_levels().get('channels', {}).items():
+                    print(f"{name}: peak {level['max_peak_db']:.1f} dBFS, true peak "
+                          f"{level['max_true_peak_db']:.1f} dBTP, {level['clipped_samples']} clipped samples")
+            if self.profiling:
+                print("\nRender Profile:")
+                print("--------------")
+                print(self.get_profile())
 
     def run(self):
         print("\nStarting synthesizer...")
@@ -104,9 +238,12 @@ class Synthesizer:
         try:
             print("Audio Configuration:")
             print("-------------------")
-            print(f"Sample Rate: {self.sample_rate} Hz")
+            print(f"Sample Rate: {self.device_rate} Hz")
+            if self.resampler:
+                print(f"Engine Rate: {self.sample_rate} Hz (polyphase {self.resampler.up}/{self.resampler.down}, "
+                      f"{self.resampler.latency / self.device_rate * 1000:.2f} ms filter delay)")
             print(f"Block Size: {self.block_size} samples")
-            print(f"Buffer Length: {self.block_size/self.sample_rate*1000:.1f} ms")
+            print(f"Buffer Length: {self.block_size/self.device_rate*1000:.1f} ms")
             
             print("\nInitializing Audio System...")
             print("------------------------")
@@ -137,6 +274,10 @@ class Synthesizer:
             print("\nPress Ctrl+C to stop the synthesizer")
             print("=====================================")
 
+            if self.audio_output.backend:
+                self.run_headless()
+                return
+
             try:
                 device_info = None
                 try:
@@ -149,8 +290,8 @@ class Synthesizer:
                     pass
 
                 stream_settings = {
-                    'channels': 1,
-                    'samplerate': self.sample_rate,
+                    'channels': self.channels,
+                    'samplerate': self.device_rate,
                     'blocksize': self.block_size,
                     'callback': self.audio_callback
                 }
@@ -158,7 +299,7 @@ class Synthesizer:
                 if device_info:
                     stream_settings['device'] = default_device
                     print(f"Sample Rate: {device_info['default_samplerate']} Hz")
-                    print(f"Channels: {device_info['max_output_channels']}")
+                    print(f"Channels: {self.channels} of {device_info['max_output_channels']}")
                 
                 with sd.OutputStream(**stream_settings):
                     print("\nAudio stream started successfully")
@@ -169,6 +310,7 @@ class Synthesizer:
                     print("- CC 75: Sustain Level")
                     print("- CC 76: Release Time")
                     print("- CC 77: Oscillator Type")
+                    print("- CC 1: FM Modulation Depth")
                     while True:
                         sd.sleep(100)
                         
@@ -178,9 +320,9 @@ class Synthesizer:
             except sd.PortAudioError as e:
                 print(f"\nAudio device error: {e}")
                 print("Continuing with null audio backend for testing")
-                print("\nMIDI events will be processed and voice generation simulated")
-                while True:
-                    sd.sleep(100)
+                self.audio_output._create_null_backend()
+                self.audio_output.backend.start()
+                self.run_headless()
                 
         except Exception as e:
             print(f"\nUnexpected error: {e}")
@@ -1,47 +1,271 @@
 import numpy as np
-from oscillator import Oscillator, midi_to_freq
-from envelope import ADSREnvelope
+from oscillator import Oscillator, OscillatorBank, UnisonOscillator, midi_to_freq
+from envelope import ADSREnvelope, control_rate_for
+from render_cache import RenderCache
+from polyphony import PolyphonyGovernor
+import time
 
 class Voice:
     def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
         self.oscillator = Oscillator(sample_rate)
         self.envelope = ADSREnvelope(sample_rate)
         self.note = None
         self.velocity = 0
         self.active = False
+        self.index = 0  # Row in VoiceManager.bus_gains, stable across stealing
+        self.stereo = False  # Set per block by VoiceManager: render unison spread as (2, frames)
+
+        # One-shot render cache (see RenderCache); cached holds the unity-velocity render
+        self.render_cache = None
+        self.key_sync = False  # Restart one-shots from phase 0 and silence; on while the cache is enabled
+        self.cached = None
+        self.cache_pending = False
+        self.cache_pos = 0
+        self.cache_block = 0
+
+        # Set by VoiceManager: note-on order for stealing, and the shed fade-out
+        self.started = 0
+        self.fade_remaining = 0
+        self.fade_length = 0
+
+        # Linear gain below which a sustaining/releasing voice is retired (-1 = never)
+        self.silence_threshold = -1.0
         
     def note_on(self, note, velocity):
         self.note = note
         self.velocity = velocity / 127.0
         self.oscillator.set_frequency(midi_to_freq(note))
+        self.oscillator.note_on()
         self.envelope.note_on()
         self.active = True
+
+        # Resolved on the first block, since envelope ramps depend on the block size
+        self.cached = None
+        one_shot = self.is_one_shot()
+        if one_shot and self.key_sync:
+            # Cached one-shots restart from phase 0 and from silence, so every hit
+            # sounds the same whether it is played live or from the cached render
+            self.oscillator.phase = 0
+            self.envelope.current_level = 0.0
+        self.cache_pending = self.render_cache is not None and one_shot
         
     def note_off(self):
+        self.cache_pending = False
+        self.leave_cache()
         self.envelope.note_off()
+
+    def is_one_shot(self):
+        # Sustain 0 means nothing after attack+decay depends on note length.
+        # Unison stacks randomize phase per note, so only plain oscillators qualify.
+        return self.envelope.sustain == 0 and type(self.oscillator) is Oscillator
+
+    def one_shot_key(self, note, block_size):
+        # Velocity is a plain gain and sustain/release don't shape a one-shot,
+        # so they stay out of the key and every velocity shares one render
+        env = self.envelope
+        return (note, self.oscillator.current_type, env.attack, env.decay,
+                self.sample_rate, block_size)
+
+    def render_one_shot(self):
+        """Attack + decay of the current note from phase 0 at unity velocity"""
+        oscillator = Oscillator(self.sample_rate)
+        oscillator.set_type(self.oscillator.current_type)
+        oscillator.set_frequency(self.oscillator.freq)
+        envelope = self.copy_envelope()
+        envelope.note_on()
+        length = int(envelope.attack * self.sample_rate) + int(envelope.decay * self.sample_rate)
+        return self.replay(oscillator.get_samples, length) * self.replay(envelope.get_envelope, length)
+
+    def replay(self, render, num_samples):
+        # Render in the same block-sized steps the live voice would use
+        blocks = [render(min(self.cache_block, num_samples - start))
+                  for start in range(0, num_samples, self.cache_block)]
+        return np.concatenate(blocks) if blocks else np.zeros(0)
+
+    def copy_envelope(self):
+        envelope = ADSREnvelope(self.sample_rate)
+        envelope.set_attack(self.envelope.attack)
+        envelope.set_decay(self.envelope.decay)
+        envelope.set_sustain(self.envelope.sustain)
+        envelope.set_release(self.envelope.release)
+        return envelope
+
+    def leave_cache(self):
+        """Hand a cached note back to live synthesis at exactly the same point"""
+        # MIDI handlers may get here first from another thread; then there's nothing left to do
+        cached = self.cached
+        if cached is None:
+            return
+        position = self.cache_pos
+        if position >= len(cached):
+            self.envelope.state = 'sustain'
+            self.envelope.current_level = self.envelope.sustain
+        else:
+            replay = self.copy_envelope()
+            replay.note_on()
+            self.replay(replay.get_envelope, position)
+            self.envelope.state = replay.state
+            self.envelope.current_level = replay.current_level
+            self.envelope.samples_processed = replay.samples_processed
+        # Same block-sized phase steps the live oscillator would have taken from phase 0
+        self.oscillator.phase = 0
+        for start in range(0, position, self.cache_block):
+            self.oscillator.advance(min(self.cache_block, position - start))
+        self.cached = None
+
+    def drop_cache(self):
+        """Continue a cached note live, before a parameter change its render doesn't include"""
+        self.cache_pending = False
+        self.leave_cache()
+
+    def set_unison(self, unison, detune=20.0, spread=0.5):
+        old = self.oscillator
+        if unison > 1:
+            if isinstance(old, UnisonOscillator):
+                old.set_unison(unison, detune, spread)
+                return
+            self.oscillator = UnisonOscillator(self.sample_rate, unison, detune, spread)
+        elif isinstance(old, UnisonOscillator):
+            self.oscillator = Oscillator(self.sample_rate)
+        else:
+            return
+        self.oscillator.set_type(old.current_type)
+        self.oscillator.set_frequency(old.freq)
         
     def is_active(self):
         return self.active and self.envelope.state != 'idle'
+
+    def retire(self):
+        self.active = False
+        self.envelope.state = 'idle'
+        self.envelope.current_level = 0.0
+
+    def level(self):
+        """Current output gain, used to pick the least audible voice to shed"""
+        cached = self.cached
+        if cached is not None:
+            # Cached one-shots don't run the envelope: use the peak of the block just played
+            position = self.cache_pos
+            played = cached[max(0, position - self.cache_block):position]
+            return float(np.abs(played).max()) * self.velocity if len(played) else 0.0
+        return self.envelope.current_level * self.velocity
+
+    def start_fade(self, num_samples):
+        self.fade_length = self.fade_remaining = max(1, int(num_samples))
+
+    def apply_fade(self, samples):
+        """Ramp a shed voice to silence over fade_length samples, then free it"""
+        done = self.fade_length - self.fade_remaining
+        gain = 1.0 - (done + np.arange(1, len(samples) + 1)) / self.fade_length
+        samples *= np.maximum(gain, 0.0)
+        self.fade_remaining = max(0, self.fade_remaining - len(samples))
+        if self.fade_remaining == 0:
+            self.active = False
+            self.cached = None
+            self.cache_pending = False
+            self.envelope.state = 'idle'
+            self.envelope.current_level = 0.0
+        return samples
         
+    def live_oscillator(self):
+        """The plain oscillator this voice's next block renders, for OscillatorBank (None if it won't)"""
+        if self.cached is None and not self.cache_pending and type(self.oscillator) is Oscillator:
+            return self.oscillator
+        return None
+
+    def oscillator_samples(self, num_samples):
+        """Mono oscillator output, or (2, frames) when a stereo mix asks for the unison spread"""
+        if self.stereo and isinstance(self.oscillator, UnisonOscillator) and self.oscillator.spread > 0:
+            return self.oscillator.get_stereo_samples(num_samples)
+        return self.oscillator.get_samples(num_samples)
+
     def generate_samples(self, num_samples):
         if not self.active:
             return np.zeros(num_samples)
+
+        # Local copies: note_off, drop_cache and disable_render_cache may run on the
+        # MIDI thread and clear these between the check and the use
+        render_cache = self.render_cache
+        if self.cache_pending and render_cache is not None:
+            self.cache_pending = False
+            self.cache_block = num_samples
+            self.cached = render_cache.get(self.one_shot_key(self.note, num_samples), self.render_one_shot)
+            self.cache_pos = 0
+
+        cached = self.cached
+        if cached is not None:
+            chunk = cached[self.cache_pos:self.cache_pos + num_samples]
+            self.cache_pos += len(chunk)
+            if len(chunk) == num_samples:
+                return chunk * self.velocity
+            # One-shot finished inside this block; continue live for the rest
+            self.leave_cache()
+            output = np.empty(num_samples)
+            output[:len(chunk)] = chunk * self.velocity
+            output[len(chunk):] = self.generate_samples(num_samples - len(chunk))
+            return output
+
+        # Constant-gain segment (sustain): one scalar multiply instead of an envelope array
+        level = self.envelope.constant_level()
+        if level is not None:
+            gain = level * self.velocity
+            if gain <= self.silence_threshold or self.envelope.state == 'idle':
+                self.retire()
+                return np.zeros(num_samples)
+            self.envelope.current_level = level
+            return self.oscillator_samples(num_samples) * gain
             
-        samples = self.oscillator.get_samples(num_samples)
+        samples = self.oscillator_samples(num_samples)
         envelope = self.envelope.get_envelope(num_samples)
         
         if not self.is_active():
             self.active = False
+        elif (self.envelope.state == 'release'
+              and self.envelope.current_level * self.velocity <= self.silence_threshold):
+            self.retire()  # Rest of the release tail is inaudible
             
         return samples * envelope * self.velocity
 
 class VoiceManager:
-    def __init__(self, sample_rate, max_voices=16):
+    def __init__(self, sample_rate, max_voices=16, verbose=True, silence_threshold_db=-90.0,
+                 channels=1, sends=0):
         self.voices = [Voice(sample_rate) for _ in range(max_voices)]
+        for i, voice in enumerate(self.voices):
+            voice.index = i
         self.sample_rate = sample_rate
+        self.verbose = verbose  # Print voice status updates to the console
+        self.set_silence_threshold(silence_threshold_db)
         self._last_active_count = 0  # For tracking voice count changes
+        self.render_cache = None
+        self.governor = None
+        self.banks = []  # Batch renderers shared by the voices (e.g. fm.FMBank), rendered once per block
+        self.oscillator_bank = OscillatorBank()  # Renders the plain oscillators of a block together
+        self.control_rate = 1  # Samples per FM envelope/modulation value (see envelope.QUALITY_TIERS)
+        self._note_counter = 0
+        self._stack = np.empty((max_voices, 0))
+        self.configure_buses(channels, sends)
+
+    def sounding_voices(self):
+        return [v for v in self.voices if v.is_active() and not v.fade_remaining]
+
+    def shed_voices(self, count, candidates=None):
+        """Fade out the count least audible voices: quietest first, then oldest releasing"""
+        if count <= 0:
+            return
+        candidates = self.sounding_voices() if candidates is None else candidates
+        candidates.sort(key=lambda v: (round(v.level(), 3), v.envelope.state != 'release', v.started))
+        fade_ms = self.governor.fade_ms if self.governor else 5.0
+        for voice in candidates[:count]:
+            voice.start_fade(fade_ms / 1000.0 * self.sample_rate)
+            if self.governor:
+                self.governor.voices_shed += 1
         
     def note_on(self, note, velocity):
+        if self.governor:
+            sounding = self.sounding_voices()
+            self.shed_voices(len(sounding) - self.governor.voice_limit + 1, sounding)
+
         # First try to find an inactive voice
         voice = next((v for v in self.voices if not v.is_active()), None)
         
@@ -51,6 +275,12 @@ class VoiceManager:
             # Rotate voices to maintain age order
             self.voices = self.voices[1:] + [self.voices[0]]
             
+        voice.fade_remaining = 0
+        self._note_counter += 1
+        voice.started = self._note_counter
+        self.voice_pan[voice.index] = self.default_pan
+        self.voice_sends[voice.index] = self.default_sends
+        self._update_bus_gains(voice.index)
         voice.note_on(note, velocity)
         
     def note_off(self, note):
@@ -59,24 +289,64 @@ class VoiceManager:
                 voice.note_off()
                 
     def get_audio_block(self, num_samples):
-        # Mix all active voices
-        mixed = np.zeros(num_samples)
+        """Mono mix of all active voices"""
+        return self.mix_voices(num_samples)
+
+    def get_bus_block(self, num_samples):
+        """(frames, channels + sends) mix, each voice routed through its row of bus_gains"""
+        return self.mix_voices(num_samples, self.bus_gains)
+
+    def mix_voices(self, num_samples, bus_gains=None):
+        if self.governor:
+            start = time.perf_counter()
+
+        if self._stack.shape[1] != num_samples:
+            self._stack = np.empty((len(self.voices), num_samples))
+
+        for bank in self.banks:
+            bank.render(num_samples)
+        self.oscillator_bank.render(self.live_oscillators(), num_samples)
+
+        # Render active voices into consecutive rows of a (voices, frames) stack
         active_voices = 0
+        active_rows = []
         active_notes = []
+        sides = []  # (side signal, bus row) of voices rendered in stereo
+        stereo = bus_gains is not None and self.channels > 1
         
         for voice in self.voices:
             if voice.is_active():
-                mixed += voice.generate_samples(num_samples)
+                voice.stereo = stereo
+                samples = voice.generate_samples(num_samples)
+                if voice.fade_remaining:
+                    samples = voice.apply_fade(samples)
+                if samples.ndim == 2:
+                    # Unison spread: the mid goes through the stack, the side is added to L/R below
+                    self._stack[active_voices] = (samples[0] + samples[1]) * 0.5
+                    sides.append(((samples[0] - samples[1]) * 0.5, voice.index))
+                else:
+                    self._stack[active_voices] = samples
+                active_rows.append(voice.index)
                 active_voices += 1
                 note = voice.note
                 note_name = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'][note % 12]
                 octave = (note // 12) - 1
                 active_notes.append(f"{note_name}{octave}")
                 
+        stack = self._stack[:active_voices]
+        if bus_gains is None:
+            mixed = stack.sum(axis=0) if active_voices else np.zeros(num_samples)
+        else:
+            # One (frames, voices) x (voices, buses) product for every pan and send
+            mixed = stack.T @ bus_gains[active_rows]
+            for side, row in sides:
+                mixed[:, 0] += side * bus_gains[row, 0]
+                mixed[:, 1] -= side * bus_gains[row, 1]
+
         # Prevent clipping by normalizing based on voice count
         if active_voices > 0:
             mixed /= max(1, np.sqrt(active_voices))
-            if len(active_notes) != self._last_active_count:
+            if self.verbose and len(active_notes) != self._last_active_count:
                 print("\nVoice Status Update:")
                 print("-----------------")
                 print(f"Active Voices: {active_voices}")
@@ -90,25 +360,216 @@ class VoiceManager:
                         octave = (voice.note // 12) - 1
                         print(f"  Voice {i:2d}: {note_name}{octave} (MIDI: {voice.note}, Velocity: {voice.velocity*127:.0f})")
                 self._last_active_count = len(active_notes)
+
+        if self.governor:
+            sounding = self.sounding_voices()
+            limit = self.governor.update(time.perf_counter() - start,
+                                         num_samples / self.sample_rate, len(sounding))
+            self.shed_voices(len(sounding) - limit, sounding)
             
         return mixed
+
+    def live_oscillators(self):
+        """Plain oscillators of the active voices that render live this block"""
+        oscillators = (voice.live_oscillator() for voice in self.voices if voice.is_active())
+        return [oscillator for oscillator in oscillators if oscillator is not None]
+
+    def configure_buses(self, channels=1, sends=0):
+        """Output layout: channels main outputs (1 = mono, 2 = stereo) followed by sends effect buses"""
+        self.channels = channels
+        self.sends = sends
+        self.default_pan = 0.0
+        self.default_sends = np.zeros(sends)
+        self.voice_pan = np.zeros(len(self.voices))
+        self.voice_sends = np.zeros((len(self.voices), sends))
+        self.bus_gains = np.zeros((len(self.voices), channels + sends))
+        self._update_bus_gains()
+
+    def _update_bus_gains(self, rows=slice(None)):
+        if self.channels == 1:
+            self.bus_gains[rows, 0] = 1.0
+        else:
+            # Equal-power pan across the first two channels; any others stay silent
+            angle = (self.voice_pan[rows] + 1.0) * np.pi / 4.0
+            self.bus_gains[rows, 0] = np.cos(angle)
+            self.bus_gains[rows, 1] = np.sin(angle)
+        self.bus_gains[rows, self.channels:] = self.voice_sends[rows]
+
+    def set_pan(self, pan, note=None):
+        """Pan (-1 left .. 1 right) for voices playing note, or the default for every voice"""
+        pan = float(np.clip(pan, -1.0, 1.0))
+        if note is None:
+            self.default_pan = pan
+            self.voice_pan[:] = pan
+            self._update_bus_gains()
+            return
+        for voice in self.voices:
+            if voice.note == note and voice.is_active():
+                self.voice_pan[voice.index] = pan
+                self._update_bus_gains(voice.index)
+
+    def set_send(self, send, level, note=None):
+        """Send level (0-1) to effect bus send for voices playing note, or for every voice"""
+        level = float(np.clip(level, 0.0, 1.0))
+        if note is None:
+            self.default_sends[send] = level
+            self.voice_sends[:, send] = level
+            self._update_bus_gains()
+            return
+        for voice in self.voices:
+            if voice.note == note and voice.is_active():
+                self.voice_sends[voice.index, send] = level
+                self._update_bus_gains(voice.index)
+
+    def set_silence_threshold(self, threshold_db):
+        """Retire voices once their level drops below threshold_db dBFS (None disables)"""
+        self.silence_threshold_db = threshold_db
+        self.silence_threshold = 10.0 ** (threshold_db / 20.0) if threshold_db is not None else -1.0
+        for voice in self.voices:
+            voice.silence_threshold = self.silence_threshold
+
+    def enable_governor(self, **kwargs):
+        """Let the voice limit follow measured CPU headroom (see PolyphonyGovernor)"""
+        self.governor = PolyphonyGovernor(len(self.voices), **kwargs)
+
+    def disable_governor(self):
+        self.governor = None
+
+    def get_governor_stats(self):
+        return self.governor.get_stats() if self.governor else None
         
+    def handle_midi_message(self, message, _=None):
+        """Apply one channel voice message; the single dispatch for the synth, render server and replay"""
+        kind = message[0] & 0xF0
+        if kind == 0x90 and message[2] > 0:
+            self.note_on(message[1], message[2])
+        elif kind in (0x80, 0x90):
+            self.note_off(message[1])
+        elif kind == 0xB0:
+            self.handle_control_change(message[1], message[2])
+
+    def handle_control_change(self, control, value):
+        normalized_value = value / 127.0
+        if control == 73:  # Attack
+            self.set_attack(normalized_value * 2.0)
+        elif control == 74:  # Decay
+            self.set_decay(normalized_value * 2.0)
+        elif control == 75:  # Sustain
+            self.set_sustain(normalized_value)
+        elif control == 76:  # Release
+            self.set_release(normalized_value * 2.0)
+        elif control == 77:  # Oscillator Type (FM: algorithm)
+            self.set_oscillator_type(int(normalized_value * 3))
+        elif control == 1:  # Mod wheel: FM modulation depth
+            for bank in self.banks:
+                bank.mod_depth = normalized_value * 2.0
+
+    def apply_patch(self, patch):
+        """Apply a patch dict (attack/decay/sustain/release/waveform/unison/quality or control_rate)"""
+        if 'quality' in patch or 'control_rate' in patch:
+            self.set_control_rate(control_rate_for(patch))
+        if 'attack' in patch:
+            self.set_attack(patch['attack'])
+        if 'decay' in patch:
+            self.set_decay(patch['decay'])
+        if 'sustain' in patch:
+            self.set_sustain(patch['sustain'])
+        if 'release' in patch:
+            self.set_release(patch['release'])
+        if 'waveform' in patch:
+            self.set_oscillator_type(patch['waveform'])
+        if 'unison' in patch:
+            self.set_unison(**patch['unison'])
+
+    def set_control_rate(self, rate):
+        """Evaluate FM envelopes and modulation every rate samples (1 = every sample).
+
+        ADSR voices keep per-sample envelopes; they only glide sustain changes over rate samples.
+        """
+        self.control_rate = max(1, int(rate))
+        for voice in self.voices:
+            voice.envelope.control_rate = self.control_rate
+        for bank in self.banks:
+            bank.control_rate = self.control_rate
+
     def set_attack(self, value):
         for voice in self.voices:
+            voice.drop_cache()
             voice.envelope.set_attack(value)
+        for bank in self.banks:
+            bank.set_carrier_envelope('attack', value)
             
     def set_decay(self, value):
         for voice in self.voices:
+            voice.drop_cache()
             voice.envelope.set_decay(value)
+        for bank in self.banks:
+            bank.set_carrier_envelope('decay', value)
             
     def set_sustain(self, value):
         for voice in self.voices:
+            voice.drop_cache()
             voice.envelope.set_sustain(value)
+        for bank in self.banks:
+            bank.set_carrier_envelope('sustain', value)
             
     def set_release(self, value):
         for voice in self.voices:
             voice.envelope.set_release(value)
+        for bank in self.banks:
+            bank.set_carrier_envelope('release', value)
             
     def set_oscillator_type(self, type_idx):
         for voice in self.voices:
+            voice.drop_cache()
             voice.oscillator.set_type(type_idx)
+        for bank in self.banks:
+            if isinstance(type_idx, int):
+                bank.select_algorithm(type_idx)
+
+    def set_voice_factory(self, factory):
+        """Rebuild the voice pool with factory(sample_rate), keeping envelope settings and waveform"""
+        # Read the settings before the old voices are replaced
+        envelope = self.voices[0].envelope
+        attack, decay, sustain, release = envelope.attack, envelope.decay, envelope.sustain, envelope.release
+        waveform = self.voices[0].oscillator.current_type
+        self.banks = []
+        self.voices = [factory(self.sample_rate) for _ in range(len(self.voices))]
+        for i, voice in enumerate(self.voices):
+            voice.index = i
+            voice.envelope.set_attack(attack)
+            voice.envelope.set_decay(decay)
+            voice.envelope.set_sustain(sustain)
+            voice.envelope.set_release(release)
+            voice.envelope.control_rate = self.control_rate
+            voice.oscillator.set_type(waveform)
+            voice.render_cache = self.render_cache
+            voice.key_sync = self.render_cache is not None
+            voice.silence_threshold = self.silence_threshold
+
+    def enable_render_cache(self, max_bytes=32 * 1024 * 1024):
+        """Cache rendered one-shots (sustain 0 patches) and replay them by slicing.
+
+        While the cache is on, one-shots restart from phase 0 and from silence
+        (key sync), so cached and live hits are sample-identical.
+        """
+        self.render_cache = RenderCache(max_bytes)
+        for voice in self.voices:
+            voice.render_cache = self.render_cache
+            voice.key_sync = True
+            voice.silence_threshold = self.silence_threshold
+
+    def disable_render_cache(self):
+        self.render_cache = None
+        for voice in self.voices:
+            voice.render_cache = None
+            voice.key_sync = False
+
+    def get_cache_stats(self):
+        return self.render_cache.get_stats() if self.render_cache else None
+
+    def set_unison(self, unison, detune=20.0, spread=0.5):
+        """Stack up to 16 detuned oscillators per voice (1 = plain oscillator)"""
+        for voice in self.voices:
+            voice.drop_cache()
+            voice.set_unison(unison, detune, spread)